@@ -0,0 +1,67 @@
+# encoding: utf-8
+
+"""Compare how long an idle polling tick takes with a full rescan of the
+tree, versus the incremental scan that only lists directories again when
+their mtime changed.
+
+Run with ``python -m bench.poller_scan`` from the repository root.
+"""
+
+import os
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+from lifesaver.poller import Poller
+
+DIRECTORIES = 100
+FILES_PER_DIRECTORY = 100
+NUMBER = 5
+REPEAT = 5
+
+
+def make_tree(root: Path) -> None:
+    for index in range(DIRECTORIES):
+        directory = root / f"ext_{index}"
+        directory.mkdir()
+        for file_index in range(FILES_PER_DIRECTORY):
+            (directory / f"module_{file_index}.py").touch()
+
+    # make the listings trustworthy straight away
+    past = time.time() - 60
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (past, past))
+
+
+def full_scan(poller: Poller) -> None:
+    # how every tick used to work
+    state = {}
+    for path in poller.paths:
+        state.update(
+            {
+                entry: entry.stat().st_mtime
+                for entry in path.glob("**/*")
+                if entry.is_file() and poller.filter_entry(entry)
+            }
+        )
+    assert state == poller.state
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        make_tree(root)
+        poller = Poller(root, backend="polling")
+        print(f"{len(poller.state)} files in {DIRECTORIES} directories")
+
+        for name, function in [
+            ("full scan", lambda: full_scan(poller)),
+            ("incremental scan", poller.detect),
+        ]:
+            best = min(timeit.repeat(function, number=NUMBER, repeat=REPEAT)) / NUMBER
+            print(f"{name:>16}: {best * 1000:8.1f}ms per idle tick")
+
+
+if __name__ == "__main__":
+    main()
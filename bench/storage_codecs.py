@@ -0,0 +1,63 @@
+# encoding: utf-8
+
+"""Compare Storage's codecs by save time, load time, and size on disk.
+
+Run with ``python -m bench.storage_codecs`` from the repository root.
+"""
+
+import os
+import tempfile
+import timeit
+
+from lifesaver.bot.storage import (
+    Codec,
+    CompressedCodec,
+    JsonCodec,
+    MarshalCodec,
+    Storage,
+)
+
+SIZE = 20_000
+REPEAT = 5
+
+CODECS: dict[str, Codec] = {
+    "json (indent=2)": JsonCodec(indent=2),
+    "json": JsonCodec(),
+    "json + zlib": CompressedCodec(JsonCodec()),
+    "json + lzma": CompressedCodec(JsonCodec(), compression="lzma"),
+    "marshal": MarshalCodec(),
+    "marshal + zlib": CompressedCodec(MarshalCodec()),
+    "marshal + lzma": CompressedCodec(MarshalCodec(), compression="lzma"),
+}
+
+
+def value(n: int) -> dict:
+    return {"id": n, "name": f"user {n}", "tags": ["a", "b", "c"], "score": n * 1.5}
+
+
+def main() -> None:
+    data = {f"key:{n}": value(n) for n in range(SIZE)}
+    print(f"{SIZE:,} keys")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, codec in CODECS.items():
+            file = os.path.join(directory, name)
+            storage = Storage(file, codec=codec)
+            storage._data = data
+
+            save = min(
+                timeit.repeat(
+                    lambda: storage._save(data.copy()), number=1, repeat=REPEAT
+                )
+            )
+            load = min(timeit.repeat(storage._load, number=1, repeat=REPEAT))
+            size = os.path.getsize(file)
+
+            print(
+                f"{name:>16}: save {save * 1000:8.2f}ms, load {load * 1000:8.2f}ms,"
+                f" {size / 1024:9.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# encoding: utf-8
+
+"""Measure how long Storage takes to save as the store and the number of
+changed keys grow.
+
+Run with ``python -m bench.storage_save`` from the repository root.
+"""
+
+import os
+import tempfile
+import timeit
+
+from lifesaver.bot.storage import Storage
+
+SIZES = (1_000, 10_000, 50_000)
+DIRTY_COUNTS = (1, 100, 1_000)
+REPEAT = 5
+
+
+def value(n: int) -> dict:
+    return {"id": n, "name": f"user {n}", "tags": ["a", "b", "c"], "score": n * 1.5}
+
+
+def bench(directory: str, size: int) -> None:
+    storage = Storage(os.path.join(directory, f"{size}.json"))
+    storage._data = {f"key:{n}": value(n) for n in range(size)}
+
+    full = min(
+        timeit.repeat(
+            lambda: storage._save(storage._data.copy()), number=1, repeat=REPEAT
+        )
+    )
+    print(f"{size:>7,} keys, full save: {full * 1000:9.2f}ms")
+
+    for dirty_count in DIRTY_COUNTS:
+        dirty = {f"key:{n}" for n in range(dirty_count)}
+        incremental = min(
+            timeit.repeat(
+                lambda: storage._save(storage._data.copy(), dirty),
+                number=1,
+                repeat=REPEAT,
+            )
+        )
+        print(
+            f"{size:>7,} keys, {dirty_count:>5,} dirty: {incremental * 1000:9.2f}ms"
+            f" ({full / incremental:.1f}x)"
+        )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            bench(directory, size)
+
+
+if __name__ == "__main__":
+    main()
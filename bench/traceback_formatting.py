@@ -0,0 +1,55 @@
+# encoding: utf-8
+
+"""Compare how long the event loop is blocked by formatting a traceback on
+the loop, versus only capturing it there and formatting it in a thread.
+
+Run with ``python -m bench.traceback_formatting`` from the repository root.
+"""
+
+import linecache
+import timeit
+
+from lifesaver.utils import capture_traceback, format_traceback
+
+DEPTH = 30
+NUMBER = 1_000
+REPEAT = 5
+
+
+def recurse(depth: int) -> None:
+    if depth:
+        recurse(depth - 1)
+    raise RuntimeError("bench")
+
+
+def make_error() -> BaseException:
+    try:
+        recurse(DEPTH)
+    except RuntimeError as error:
+        return error
+    raise AssertionError
+
+
+def main() -> None:
+    error = make_error()
+
+    def format_on_loop() -> None:
+        # the source lines are cached after the first error, which makes this
+        # look better than it is during a storm of different errors
+        linecache.clearcache()
+        format_traceback(error, shorten_paths=True)
+
+    def capture_on_loop() -> None:
+        linecache.clearcache()
+        capture_traceback(error)
+
+    for name, function in [
+        ("format_traceback", format_on_loop),
+        ("capture_traceback", capture_on_loop),
+    ]:
+        best = min(timeit.repeat(function, number=NUMBER, repeat=REPEAT)) / NUMBER
+        print(f"{name:>18}: {best * 1_000_000:8.1f}μs on the loop per error")
+
+
+if __name__ == "__main__":
+    main()
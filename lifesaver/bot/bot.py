@@ -201,7 +201,11 @@ class BotBase(commands.bot.BotBase, GroupMixin["lifesaver.Cog"]):
     async def _setup_hot_reload(self) -> None:
         self.log.debug("Setting up hot reload.")
 
-        self._hot_reload_poller = Poller(Path(self.config.extensions_path))
+        self._hot_reload_poller = Poller(
+            Path(self.config.extensions_path),
+            debounce=self.config.hot_reload_debounce,
+            content_hash=self.config.hot_reload_content_hash,
+        )
         self.log.debug("Created poller: %r", self._hot_reload_poller)
 
         # setup plug, which handles the extension {un,re,}loading for us
@@ -216,6 +220,7 @@ class BotBase(commands.bot.BotBase, GroupMixin["lifesaver.Cog"]):
         assert self._hot_reload_poller is not None
         assert self._hot_plug is not None
 
+        # the poller debounces events, so this runs once per batch of changes
         async for event in self._hot_reload_poller:
             await self._hot_plug.handle(event)
             self._rebuild_load_list()
@@ -82,6 +82,14 @@ class BotConfig(Config):
     #: Enables the hot reloader.
     hot_reload: bool = False
 
+    #: How many seconds the hot reloader waits for changes to settle down
+    #: before acting on them all at once.
+    hot_reload_debounce: float = 1.5
+
+    #: Makes the hot reloader compare the contents of files instead of only
+    #: their modification times, so that touching a file doesn't reload it.
+    hot_reload_content_hash: bool = False
+
     #: The global bot emoji table.
     emojis: Dict[str, Any] = DEFAULT_EMOJIS
 
@@ -2,13 +2,15 @@
 
 import asyncio
 import datetime
+import hashlib
+import itertools
 import json
 import secrets
 import sys
 import dataclasses
 from dataclasses import field
-from collections import OrderedDict
-from typing import NamedTuple, Any
+from collections import Counter, OrderedDict
+from typing import Collection, NamedTuple, Any, Optional
 
 import discord
 from discord.ext import commands
@@ -16,10 +18,11 @@ from discord.ext import commands
 import lifesaver
 from lifesaver.bot.storage import Storage
 from lifesaver.utils import (
+    CircuitBreaker,
     codeblock,
-    format_traceback,
     human_delta,
     pluralize,
+    render_traceback,
     truncate,
 )
 
@@ -33,20 +36,88 @@ def summarize_traceback(traceback: str, *, max_len: int = 30) -> str:
     return truncate(last_line, max_len)
 
 
+def fingerprint_error(error: BaseException) -> str:
+    """Compute a fingerprint of an exception from its type and the code
+    locations of its traceback, including those of the exceptions it was
+    chained from.
+
+    Exceptions raised by the same bug have the same fingerprint.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    seen = set()
+    current: Optional[BaseException] = error
+
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        digest.update(
+            f"{type(current).__module__}.{type(current).__qualname__}\n".encode()
+        )
+
+        tb = current.__traceback__
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            digest.update(
+                f"{code.co_filename}:{code.co_name}:{tb.tb_lineno}\n".encode()
+            )
+            tb = tb.tb_next
+
+        if current.__cause__ is not None:
+            current = current.__cause__
+        elif not current.__suppress_context__:
+            current = current.__context__
+        else:
+            current = None
+
+    return digest.hexdigest()
+
+
+def _same_members(collection: Collection[type], snapshot: frozenset[type]) -> bool:
+    if isinstance(collection, (set, frozenset)):
+        # compared without copying
+        return collection == snapshot
+    return frozenset(collection) == snapshot
+
+
 @dataclasses.dataclass
 class Insect:
     traceback: str
     id: str = field(default_factory=lambda: secrets.token_hex(6))
     creation_time: datetime.datetime = field(default_factory=discord.utils.utcnow)
 
+    #: The fingerprint of the errors that this insect groups together. Insects
+    #: from before errors were grouped don't have one.
+    fingerprint: Optional[str] = None
+
+    #: The number of times that this error has occurred.
+    count: int = 1
+
+    #: When this error last occurred.
+    last_seen: Optional[datetime.datetime] = None
+
+    #: The IDs given out for the first and the latest occurrences of this
+    #: error.
+    sample_ids: list[str] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        if self.last_seen is None:
+            self.last_seen = self.creation_time
+        if not self.sample_ids:
+            self.sample_ids.append(self.id)
+
     def __eq__(self, other: Any) -> bool:
         if isinstance(other, Insect):
             return other.id == self.id
         return NotImplemented
 
+    @property
+    def group_key(self) -> str:
+        """The key that this insect is grouped under."""
+        return self.fingerprint or self.id
+
     def format(self) -> str:
         summary = summarize_traceback(self.traceback)
-        return f'\N{BUG} **`{self.id}`** `{summary}` {discord.utils.format_dt(self.creation_time, "R")}'
+        count = f" \N{MULTIPLICATION SIGN}{self.count}" if self.count > 1 else ""
+        return f'\N{BUG} **`{self.id}`**{count} `{summary}` {discord.utils.format_dt(self.last_seen, "R")}'
 
 
 class ErrorHandler(NamedTuple):
@@ -59,18 +130,30 @@ class InsectsEncoder(json.JSONEncoder):
         if isinstance(o, Insect):
             insect_dict = dataclasses.asdict(o)
             insect_dict["creation_time"] = insect_dict["creation_time"].timestamp()
+            insect_dict["last_seen"] = insect_dict["last_seen"].timestamp()
             return insect_dict
         return json.JSONEncoder.default(self, object)
 
 
 def insect_object_hook(dictionary: dict[str, Any]) -> Any:
     if "traceback" in dictionary:
+        last_seen = dictionary.get("last_seen")
         return Insect(
             traceback=dictionary["traceback"],
             id=dictionary["id"],
             creation_time=datetime.datetime.fromtimestamp(
                 dictionary["creation_time"], tz=datetime.timezone.utc
             ),
+            fingerprint=dictionary.get("fingerprint"),
+            count=dictionary.get("count", 1),
+            last_seen=(
+                None
+                if last_seen is None
+                else datetime.datetime.fromtimestamp(
+                    last_seen, tz=datetime.timezone.utc
+                )
+            ),
+            sample_ids=dictionary.get("sample_ids", []),
         )
     return dictionary
 
@@ -78,11 +161,57 @@ def insect_object_hook(dictionary: dict[str, Any]) -> Any:
 class Errors(lifesaver.Cog):
     def __init__(self, bot: lifesaver.Bot):
         super().__init__(bot)
-        self.insects = Storage[list[Insect]](
-            "./insects.json", encoder=InsectsEncoder, object_hook=insect_object_hook
+        # insects are keyed by their ID and appended to a log as they are
+        # created, so creating one doesn't rewrite every other one.
+        self.insects = Storage[Insect](
+            "./insects.json",
+            encoder=InsectsEncoder,
+            object_hook=insect_object_hook,
+            journal=True,
+            flush_interval=1.0,
         )
         self.insect_creation_lock = asyncio.Lock()
 
+        #: The retained insects by what they are grouped under, from least to
+        #: most recently seen.
+        self.recent_insects: OrderedDict[str, Insect] = OrderedDict(
+            (insect.group_key, insect)
+            for insect in sorted(
+                self._stored_insects(), key=lambda insect: insect.last_seen
+            )
+        )
+
+        # the IDs and sample IDs of the retained insects to the insects, and
+        # prefixes of those IDs to the IDs that start with them
+        self._insects_by_id: dict[str, Insect] = {}
+        self._insect_id_prefixes: dict[str, set[str]] = {}
+        for insect in self.recent_insects.values():
+            for insect_id in {insect.id, *insect.sample_ids}:
+                self._index_insect_id(insect_id, insect)
+
+        #: Trips when unhandled errors happen too quickly, such as when a
+        #: dependency is down and every command fails. While it's open, errors
+        #: are still recorded as insects, but aren't logged or replied to
+        #: individually. A summary is logged periodically instead.
+        self.breaker = CircuitBreaker(
+            self.error_storm_threshold,
+            self.error_storm_period,
+            cooldown=self.error_storm_cooldown,
+        )
+        self._storm_errors: Counter[str] = Counter()
+        self._storm_summary_task: Optional[asyncio.Task[None]] = None
+
+        # exception types to the keys of their handlers in error_handlers, and
+        # whether they are silenced. this is thrown away whenever what it was
+        # resolved from changes.
+        self._dispatch_cache: dict[type, tuple[Optional[type], bool]] = {}
+
+        # the keys of error_handlers (in order), silenced_errors and
+        # ignored_errors that the cache was resolved from
+        self._dispatch_sources: Optional[
+            tuple[tuple[type, ...], frozenset[type], frozenset[type]]
+        ] = None
+
         # clobber original on_error because it's a faux-event
         self._original_on_error = bot.on_error
         bot.on_error = self.replacement_on_error
@@ -97,6 +226,31 @@ class Errors(lifesaver.Cog):
         commands.CommandNotFound,
     }
 
+    #: The maximum number of insects to keep. The oldest ones are discarded
+    #: first.
+    max_insects = 1000
+
+    #: How long to keep insects for after they were last seen.
+    insect_retention = datetime.timedelta(days=30)
+
+    #: The number of occurrence IDs to keep for every insect.
+    max_insect_samples = 5
+
+    #: The shortest partial ID that insects can be looked up by.
+    min_insect_id_prefix = 4
+
+    #: The number of unhandled errors within :attr:`error_storm_period`
+    #: seconds that is considered an error storm.
+    error_storm_threshold = 20
+
+    #: The period of time (in seconds) that :attr:`error_storm_threshold` is
+    #: measured over.
+    error_storm_period = 10.0
+
+    #: The minimum number of seconds that an error storm lasts, which is also
+    #: how often it is summarized.
+    error_storm_cooldown = 60.0
+
     #: Default error handlers.
     error_handlers = {
         commands.TooManyArguments: ErrorHandler("Too many inputs."),
@@ -127,21 +281,240 @@ class Errors(lifesaver.Cog):
         ),
     }
 
-    def cog_unload(self):
+    async def cog_load(self):
+        legacy_insects = self.insects.get("insects")
+        expired = self._expire_insects()
+
+        if legacy_insects is None and not expired:
+            return
+
+        async with self.insects.batch():
+            if legacy_insects is not None:
+                # insects used to be stored as a single list
+                await self.insects.put_many(
+                    (insect.id, insect) for insect in legacy_insects
+                )
+                await self.insects.delete("insects")
+            await self.insects.delete_many(
+                insect_id for insect_id in expired if insect_id in self.insects
+            )
+
+    async def cog_unload(self):
         super().cog_unload()
 
         # restore original on_error
         self.bot.on_error = self._original_on_error
 
+        if self._storm_summary_task is not None:
+            self._storm_summary_task.cancel()
+
+        # written behind, so wait for the last insects to reach the disk before
+        # anything (like this extension being loaded again) reads the file
+        await self.insects.aclose()
+
+    def _stored_insects(self) -> list[Insect]:
+        insects = []
+        for value in self.insects.values():
+            if isinstance(value, list):
+                insects.extend(value)
+            else:
+                insects.append(value)
+        return insects
+
+    def _expire_insects(self) -> list[str]:
+        """Discard insects from the ring that are past retention, returning
+        their IDs.
+        """
+        cutoff = discord.utils.utcnow() - self.insect_retention
+        expired = []
+
+        while self.recent_insects:
+            oldest = next(iter(self.recent_insects.values()))
+            if len(self.recent_insects) <= self.max_insects and (
+                oldest.last_seen >= cutoff  # type: ignore
+            ):
+                break
+            self.recent_insects.popitem(last=False)
+            expired.append(oldest.id)
+
+            for insect_id in {oldest.id, *oldest.sample_ids}:
+                self._unindex_insect_id(insect_id)
+
+        return expired
+
+    def _log_storm_summary(self) -> None:
+        errors, self._storm_errors = self._storm_errors, Counter()
+        if not errors:
+            return
+
+        self.log.warning(
+            "Suppressed %s during an error storm: %s",
+            pluralize(error=sum(errors.values())),
+            ", ".join(f"{name} (x{count})" for name, count in errors.most_common()),
+        )
+
+    async def _summarize_storm(self) -> None:
+        while self.breaker.is_open:
+            await asyncio.sleep(self.error_storm_cooldown)
+            self._log_storm_summary()
+
+        self.log.warning("Error storm is over.")
+
+    def _storming(self, error: BaseException) -> bool:
+        """Record an unhandled error with the breaker, returning whether it is
+        part of an error storm and should be suppressed.
+        """
+        if not self.breaker.hit():
+            return False
+
+        self._storm_errors[type(error).__name__] += 1
+
+        if self._storm_summary_task is None or self._storm_summary_task.done():
+            self.log.warning(
+                "Error storm: %s within %s seconds. Suppressing errors and "
+                "summarizing them every %s seconds.",
+                pluralize(error=self.breaker.threshold),
+                self.breaker.per,
+                self.error_storm_cooldown,
+            )
+            self._storm_summary_task = self.loop.create_task(self._summarize_storm())
+
+        return True
+
+    def _insect_id_prefixes_of(self, insect_id: str) -> range:
+        return range(self.min_insect_id_prefix, len(insect_id))
+
+    def _index_insect_id(self, insect_id: str, insect: Insect) -> None:
+        self._insects_by_id[insect_id] = insect
+        for length in self._insect_id_prefixes_of(insect_id):
+            self._insect_id_prefixes.setdefault(insect_id[:length], set()).add(
+                insect_id
+            )
+
+    def _unindex_insect_id(self, insect_id: str) -> None:
+        if self._insects_by_id.pop(insect_id, None) is None:
+            return
+
+        for length in self._insect_id_prefixes_of(insect_id):
+            prefix = insect_id[:length]
+            insect_ids = self._insect_id_prefixes[prefix]
+            insect_ids.discard(insect_id)
+            if not insect_ids:
+                del self._insect_id_prefixes[prefix]
+
+    def _find_insect(self, insect_id: str) -> Optional[Insect]:
+        """Look up an insect by its ID, the ID of one of its sampled
+        occurrences, or an unambiguous prefix of either.
+        """
+        insect_id = insect_id.lower()
+
+        insect = self._insects_by_id.get(insect_id)
+        if insect is not None:
+            return insect
+
+        insect_ids = self._insect_id_prefixes.get(insect_id)
+        if insect_ids is None:
+            return None
+
+        insects = {self._insects_by_id[insect_id].id for insect_id in insect_ids}
+        if len(insects) > 1:
+            # ambiguous
+            return None
+        return self._insects_by_id[next(iter(insect_ids))]
+
     async def create_insect(self, error: BaseException) -> str:
-        """Create and save an insect object, returning its ID."""
+        """Create and save an insect object, returning its ID.
+
+        Errors with the same fingerprint are grouped into the same insect,
+        and the returned ID identifies this occurrence.
+        """
+        fingerprint = fingerprint_error(error)
+
         async with self.insect_creation_lock:
-            insects = self.insects.get("insects", [])
-            insect = Insect(traceback=format_traceback(error, shorten_paths=True))
-            insects.append(insect)
-            await self.insects.put("insects", insects)
+            insect = self.recent_insects.get(fingerprint)
+
+            if insect is None:
+                insect = Insect(
+                    traceback=await render_traceback(error, shorten_paths=True),
+                    fingerprint=fingerprint,
+                )
+                self.recent_insects[fingerprint] = insect
+                self._index_insect_id(insect.id, insect)
+                occurrence_id = insect.id
+            else:
+                occurrence_id = secrets.token_hex(6)
+                insect.count += 1
+                insect.last_seen = discord.utils.utcnow()
+                # keep the first occurrence, and the latest ones
+                insect.sample_ids.append(occurrence_id)
+                self._index_insect_id(occurrence_id, insect)
+
+                dropped = slice(1, -self.max_insect_samples + 1 or None)
+                for sample_id in insect.sample_ids[dropped]:
+                    self._unindex_insect_id(sample_id)
+                del insect.sample_ids[dropped]
+                self.recent_insects.move_to_end(fingerprint)
+
+            expired = self._expire_insects()
+
+            async with self.insects.batch():
+                await self.insects.put(insect.id, insect)
+                if expired:
+                    await self.insects.delete_many(expired)
+
+        return occurrence_id
+
+    def _resolve_handler(
+        self, error_type: type, ignored_errors: Collection[type]
+    ) -> Optional[type]:
+        # the first matching handler wins, in the order they were defined
+        return next(
+            (
+                handler_type
+                for handler_type in self.error_handlers
+                if handler_type not in ignored_errors
+                and issubclass(error_type, handler_type)
+            ),
+            None,
+        )
+
+    def _dispatch(
+        self, error_type: type, ignored_errors: Collection[type]
+    ) -> tuple[Optional[ErrorHandler], bool]:
+        """Resolve the handler for an exception type, and whether it is
+        silenced.
+
+        The first handler in :attr:`error_handlers` that the type is a
+        subclass of wins, skipping ignored ones. This is resolved once per
+        type, until :attr:`error_handlers`, :attr:`silenced_errors` or
+        ``ignored_errors`` change.
+        """
+        handlers, silenced_errors = self.error_handlers, self.silenced_errors
+        handler_types = tuple(handlers)
+        sources = self._dispatch_sources
+        if (
+            sources is None
+            or sources[0] != handler_types
+            or not _same_members(silenced_errors, sources[1])
+            or not _same_members(ignored_errors, sources[2])
+        ):
+            self._dispatch_cache.clear()
+            self._dispatch_sources = (
+                handler_types,
+                frozenset(silenced_errors),
+                frozenset(ignored_errors),
+            )
+
+        try:
+            handler_type, silenced = self._dispatch_cache[error_type]
+        except KeyError:
+            handler_type = self._resolve_handler(error_type, ignored_errors)
+            silenced = error_type in silenced_errors
+            self._dispatch_cache[error_type] = (handler_type, silenced)
 
-        return insect.id
+        if handler_type is None:
+            return None, silenced
+        return handlers[handler_type], silenced
 
     @lifesaver.group(hidden=True, hollow=True)
     @commands.is_owner()
@@ -151,16 +524,16 @@ class Errors(lifesaver.Cog):
     @errors.command(name="recent")
     async def errors_recent(self, ctx: lifesaver.Context, amount: int = 5):
         """Shows recent insects."""
-        all_insects = self.insects.get("insects", [])
+        if amount < 1:
+            await ctx.send("The amount must be at least 1.")
+            return
 
-        if not all_insects:
+        if not self.recent_insects:
             await ctx.send("There are no insects.")
             return
 
-        recent_n_insects = sorted(
-            all_insects[-amount:],
-            key=lambda insect: insect.creation_time,
-            reverse=True,
+        recent_n_insects = itertools.islice(
+            reversed(self.recent_insects.values()), amount
         )
 
         embed = discord.Embed(
@@ -168,7 +541,11 @@ class Errors(lifesaver.Cog):
             color=discord.Color.red(),
             description="\n".join(insect.format() for insect in recent_n_insects),
         )
-        embed.set_footer(text=pluralize(insect=len(all_insects)))
+        occurrences = sum(insect.count for insect in self.recent_insects.values())
+        embed.set_footer(
+            text=f"{pluralize(insect=len(self.recent_insects))}, "
+            f"{pluralize(occurrence=occurrences)}"
+        )
 
         try:
             await ctx.send(embed=embed)
@@ -178,10 +555,9 @@ class Errors(lifesaver.Cog):
     @errors.command(name="view", aliases=["show", "info"])
     async def errors_view(self, ctx: lifesaver.commands.Context, insect_id: str):
         """Views an error by insect ID."""
-        all_insects = self.insects.get("insects", [])
-        insect = discord.utils.find(lambda insect: insect.id == insect_id, all_insects)
+        insect = self._find_insect(insect_id)
 
-        if not insect:
+        if insect is None:
             await ctx.send("There is no insect with that ID.")
             return
 
@@ -192,11 +568,44 @@ class Errors(lifesaver.Cog):
         )
         embed.add_field(
             name="Occurred",
+            value=pluralize(time=insect.count),
+            inline=False,
+        )
+        embed.add_field(
+            name="First Seen",
             value=discord.utils.format_dt(insect.creation_time, "R"),
+        )
+        embed.add_field(
+            name="Last Seen",
+            value=discord.utils.format_dt(insect.last_seen, "R"),  # type: ignore
+        )
+        embed.add_field(
+            name="Sample IDs",
+            value=", ".join(f"`{sample_id}`" for sample_id in insect.sample_ids),
             inline=False,
         )
         await ctx.send(embed=embed)
 
+    @errors.command(name="breaker")
+    async def errors_breaker(self, ctx: lifesaver.Context):
+        """Shows the state of the error storm breaker."""
+        breaker = self.breaker
+
+        embed = discord.Embed(
+            title="Error Storm Breaker",
+            color=discord.Color.red() if breaker.is_open else discord.Color.green(),
+            description=f"The breaker is **{breaker.state}**.",
+        )
+        embed.add_field(
+            name="Threshold",
+            value=f"{pluralize(error=breaker.threshold)} within "
+            f"{pluralize(second=breaker.per)}",
+        )
+        embed.add_field(name="Trips", value=str(breaker.trips))
+        if breaker.is_open:
+            embed.add_field(name="Suppressed", value=str(breaker.suppressed))
+        await ctx.send(embed=embed)
+
     @errors.command(name="throw", hidden=True)
     async def errors_throw(self, ctx: lifesaver.Context, *, message: str = "!"):
         """Intentionally creates a runtime error."""
@@ -209,13 +618,14 @@ class Errors(lifesaver.Cog):
             self.log.error("Fatal error occurred, but exc_info returned None.")
             return
 
-        self.log.error(
-            "Fatal error in %s (args=%r, kwargs=%r). %s",
-            event,
-            args,
-            kwargs,
-            format_traceback(value),
-        )
+        if not self._storming(value):
+            self.log.error(
+                "Fatal error in %s (args=%r, kwargs=%r). %s",
+                event,
+                args,
+                kwargs,
+                await render_traceback(value),
+            )
 
         await self.create_insect(value)
 
@@ -229,17 +639,15 @@ class Errors(lifesaver.Cog):
             # better error message). Log the conversion failure.
             if "failed for parameter" in str(error) and error.__cause__ is not None:
                 self.log.error(
-                    "Generic conversion failed. %s", format_traceback(error.__cause__)
+                    "Generic conversion failed. %s",
+                    await render_traceback(error.__cause__),
                 )
 
-        ignored_errors = getattr(ctx.bot, "ignored_errors", [])
+        ignored_errors = getattr(ctx.bot, "ignored_errors", ())
+        handler, silenced = self._dispatch(type(error), ignored_errors)
 
-        for (
-            error_type,
-            (message_format, append_original_message),
-        ) in self.error_handlers.items():
-            if not isinstance(error, error_type) or error_type in ignored_errors:
-                continue
+        if handler is not None:
+            message_format, append_original_message = handler
 
             assert ctx.command is not None
             message = message_format.format(
@@ -251,10 +659,14 @@ class Errors(lifesaver.Cog):
             )
             return
 
-        if type(error) in self.silenced_errors:
+        if silenced:
+            return
+
+        if self._storming(error):
+            await self.create_insect(error)
             return
 
-        self.log.error("Fatal error. %s", format_traceback(error))
+        self.log.error("Fatal error. %s", await render_traceback(error))
         insect_id = await self.create_insect(error)
         await ctx.send(f"Something went wrong! \N{BUG} `{insect_id}`")
 
@@ -0,0 +1,8 @@
+# encoding: utf-8
+
+from .base import *
+from .codecs import *
+from .file import *
+from .indexed import *
+from .postgres import *
+from .sqlite import *
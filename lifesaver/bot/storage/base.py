@@ -0,0 +1,270 @@
+# encoding: utf-8
+
+__all__ = ("AsyncStorage", "StorageChange", "StorageWatcher")
+
+import asyncio
+import collections
+import collections.abc
+import contextlib
+import contextvars
+import weakref
+from abc import abstractmethod
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Generic,
+    Iterable,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Any,
+    TypeVar,
+)
+
+from typing_extensions import Self
+
+T = TypeVar("T")
+VT = TypeVar("VT")
+
+#: The default number of changes that a :class:`StorageWatcher` buffers before
+#: dropping the oldest ones.
+DEFAULT_WATCH_SIZE = 1024
+
+# the batches that the current task is part of. tasks started inside of a
+# batch inherit it.
+_batch_scopes: contextvars.ContextVar[frozenset[object]] = contextvars.ContextVar(
+    "lifesaver_batch_scopes", default=frozenset()
+)
+
+
+class StorageChange(NamedTuple):
+    """A change to a key in an :class:`AsyncStorage`."""
+
+    #: Whether the key was put or deleted.
+    kind: Literal["put", "delete"]
+    #: The key that changed.
+    key: str
+    #: The previous value of the key, or ``None`` if it had none (or the
+    #: storage doesn't know it).
+    old: Any
+    #: The new value of the key, or ``None`` if it was deleted.
+    new: Any
+
+
+class StorageWatcher(Generic[VT]):
+    """An asynchronous iterator of the changes to keys in an
+    :class:`AsyncStorage` that start with a prefix.
+
+    Created by :meth:`AsyncStorage.watch`. Changes hold references to the
+    values themselves, so values that are mutated in place after the change
+    will appear mutated in the change too.
+
+    At most ``maxsize`` changes are buffered. If the consumer falls behind,
+    the oldest changes are dropped and counted in :attr:`dropped`.
+    """
+
+    def __init__(self, storage: "AsyncStorage[VT]", prefix: str, maxsize: int) -> None:
+        self.storage = storage
+        self.prefix = prefix
+
+        #: The number of changes that were dropped because the consumer fell
+        #: behind.
+        self.dropped = 0
+
+        self._changes: collections.deque[StorageChange] = collections.deque(
+            maxlen=maxsize
+        )
+        self._wakeup = asyncio.Event()
+        self._closed = False
+
+    def _push(self, change: StorageChange) -> None:
+        if len(self._changes) == self._changes.maxlen:
+            self.dropped += 1
+        self._changes.append(change)
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """Stop receiving changes.
+
+        Iteration ends once the buffered changes have been consumed.
+        """
+        self._closed = True
+        self.storage._watchers.discard(self)
+        self._wakeup.set()
+
+    def __aiter__(self) -> "StorageWatcher[VT]":
+        return self
+
+    async def __anext__(self) -> StorageChange:
+        while not self._changes:
+            if self._closed:
+                raise StopAsyncIteration
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+        return self._changes.popleft()
+
+    async def __aenter__(self) -> "StorageWatcher[VT]":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"<StorageWatcher prefix={self.prefix!r} dropped={self.dropped}>"
+
+
+class AsyncStorage(collections.abc.Mapping[str, VT]):
+    def __init__(self) -> None:
+        self._watchers: weakref.WeakSet[StorageWatcher[VT]] = weakref.WeakSet()
+
+        # identifies the open batch, if any. batches of different tasks wait
+        # for each other.
+        self._batch_scope: Optional[object] = None
+        self._batch_lock = asyncio.Lock()
+
+    @abstractmethod
+    async def put(self, key: str, value: Any) -> None:
+        """Insert a value into storage and persist it."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, key: str, default: Optional[VT] = None) -> VT:
+        """Look up a value in storage."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove a value from storage and persist the removal."""
+        raise NotImplementedError
+
+    async def put_many(
+        self, items: Mapping[str, VT] | Iterable[tuple[str, VT]]
+    ) -> None:
+        """Insert many values into storage and persist them.
+
+        Implementations persist all of the values at once where possible.
+        """
+        for key, value in dict(items).items():
+            await self.put(key, value)
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove many values from storage and persist the removals.
+
+        Implementations persist all of the removals at once where possible.
+        """
+        for key in keys:
+            await self.delete(key)
+
+    @abstractmethod
+    def batch(self) -> AsyncContextManager[Self]:
+        """Group mutations made inside of an ``async with`` block so that they
+        are persisted together, or rolled back together if the block raises.
+
+        Only the task that opened the batch (and the tasks it starts) takes
+        part in it, so other tasks' mutations are persisted as usual.
+        """
+        raise NotImplementedError
+
+    def _batching(self) -> bool:
+        """Return whether the current task is part of the open batch."""
+        scope = self._batch_scope
+        return scope is not None and scope in _batch_scopes.get()
+
+    @contextlib.asynccontextmanager
+    async def _open_batch(self) -> AsyncIterator[None]:
+        """Open a batch that only the current task (and the tasks it starts)
+        is part of, waiting for the batches of other tasks to end first.
+        """
+        async with self._batch_lock:
+            scope = self._batch_scope = object()
+            token = _batch_scopes.set(_batch_scopes.get() | {scope})
+            try:
+                yield
+            finally:
+                _batch_scopes.reset(token)
+                self._batch_scope = None
+
+    @staticmethod
+    def _leave_batches() -> None:
+        """Stop the current task from being part of any batch, such as a
+        background task that was started inside of one.
+        """
+        _batch_scopes.set(frozenset())
+
+    async def scan(
+        self,
+        prefix: str = "",
+        *,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[tuple[str, VT]]:
+        """Iterate over keys and their values in the order of the keys.
+
+        Only keys that start with ``prefix``, are at least ``start`` and are
+        less than ``end`` are included, up to ``limit`` of them:
+
+        .. code:: python3
+
+            async for key, value in storage.scan(f"guild:{guild.id}:"):
+                ...
+
+        By default, this sorts every key. Implementations that keep their
+        keys ordered only visit the matching ones.
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        count = 0
+        for key in sorted(self):
+            if (
+                not key.startswith(prefix)
+                or (start is not None and key < start)
+                or (end is not None and key >= end)
+            ):
+                continue
+
+            try:
+                value = self[key]
+            except KeyError:
+                continue
+
+            yield key, value
+
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    def watch(
+        self, prefix: str = "", *, maxsize: int = DEFAULT_WATCH_SIZE
+    ) -> StorageWatcher[VT]:
+        """Subscribe to changes to keys that start with ``prefix``.
+
+        Every put and delete made through this storage (including values
+        expiring, and batches being rolled back) is delivered as a
+        :class:`StorageChange`:
+
+        .. code:: python3
+
+            async with self.config.watch("guild:") as changes:
+                async for change in changes:
+                    ...
+
+        Stop watching by leaving the ``async with`` block or calling
+        :meth:`StorageWatcher.close`.
+        """
+        watcher = StorageWatcher(self, prefix, maxsize)
+        self._watchers.add(watcher)
+        return watcher
+
+    def _notify(
+        self, kind: Literal["put", "delete"], key: str, old: Any, new: Any
+    ) -> None:
+        change = None
+        for watcher in self._watchers:
+            if key.startswith(watcher.prefix):
+                if change is None:
+                    change = StorageChange(kind, key, old, new)
+                watcher._push(change)
@@ -0,0 +1,191 @@
+# encoding: utf-8
+
+__all__ = ("Codec", "JsonCodec", "MarshalCodec", "CompressedCodec")
+
+import json
+import lzma
+import marshal
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Literal, Optional, Type
+
+Encoder = Type[json.JSONEncoder]
+ObjectHook = Optional[Callable[[dict[Any, Any]], Any]]
+
+#: The types that :class:`MarshalCodec` stores as-is.
+_SCALARS = (str, int, float, bool, type(None))
+
+
+class Codec(ABC):
+    """Determines how :class:`Storage` encodes its data on disk.
+
+    Data is encoded one key at a time into fragments, which are then joined
+    together. :class:`Storage` caches the fragment of every key, so only the
+    keys that changed since the last save are encoded again.
+    """
+
+    @abstractmethod
+    def encode_fragment(self, key: str, value: Any, *, encoder: Encoder) -> Any:
+        """Encode a single key and its value."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def join(self, fragments: list[Any]) -> bytes:
+        """Join encoded fragments into the contents of the file."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, raw: bytes, *, object_hook: ObjectHook) -> dict[str, Any]:
+        """Decode the contents of the file."""
+        raise NotImplementedError
+
+    def encode(self, data: dict[str, Any], *, encoder: Encoder) -> bytes:
+        """Encode all of the data at once."""
+        return self.join(
+            [
+                self.encode_fragment(key, value, encoder=encoder)
+                for key, value in data.items()
+            ]
+        )
+
+
+class JsonCodec(Codec):
+    """Encodes data as JSON.
+
+    Pass ``indent`` to pretty-print. By default, the most compact
+    representation is used.
+    """
+
+    def __init__(self, *, indent: Optional[int] = None) -> None:
+        self.indent = indent
+
+    def encode_fragment(self, key: str, value: Any, *, encoder: Encoder) -> str:
+        if self.indent is None:
+            return (
+                json.dumps(key)
+                + ":"
+                + json.dumps(value, cls=encoder, separators=(",", ":"))
+            )
+
+        encoded_value = json.dumps(value, cls=encoder, indent=self.indent)
+        # JSON strings can't contain literal newlines, so this only indents
+        # the value's structure by one more level.
+        padding = " " * self.indent
+        return (
+            padding
+            + json.dumps(key)
+            + ": "
+            + encoded_value.replace("\n", "\n" + padding)
+        )
+
+    def join(self, fragments: list[str]) -> bytes:
+        if not fragments:
+            return b"{}"
+        if self.indent is None:
+            return ("{" + ",".join(fragments) + "}").encode()
+        return ("{\n" + ",\n".join(fragments) + "\n}").encode()
+
+    def decode(self, raw: bytes, *, object_hook: ObjectHook) -> dict[str, Any]:
+        return json.loads(raw, object_hook=object_hook)
+
+    def __repr__(self) -> str:
+        return f"<JsonCodec indent={self.indent!r}>"
+
+
+class MarshalCodec(Codec):
+    """Encodes data in :mod:`marshal`'s binary format.
+
+    Only JSON-compatible types are stored. Anything else is converted through
+    the storage's encoder, and ``object_hook`` is applied to every decoded
+    dict, so encoders and object hooks that work with JSON work here too.
+    """
+
+    def _to_builtin(self, value: Any, encoder: json.JSONEncoder) -> Any:
+        if type(value) in _SCALARS:
+            return value
+        # marshal refuses subclasses (like enums), so store their plain value
+        # like JSON does
+        if isinstance(value, str):
+            return str.__str__(value)
+        if isinstance(value, int):
+            return int.__int__(value)
+        if isinstance(value, float):
+            return float.__float__(value)
+        if isinstance(value, dict):
+            # coerce keys to strings like JSON does
+            return {
+                (
+                    str.__str__(key) if isinstance(key, str) else json.dumps(key)
+                ): self._to_builtin(item, encoder)
+                for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [self._to_builtin(item, encoder) for item in value]
+        return self._to_builtin(encoder.default(value), encoder)
+
+    def _hook(self, value: Any, object_hook: Callable[[dict[Any, Any]], Any]) -> Any:
+        if isinstance(value, dict):
+            return object_hook(
+                {key: self._hook(item, object_hook) for key, item in value.items()}
+            )
+        if isinstance(value, list):
+            return [self._hook(item, object_hook) for item in value]
+        return value
+
+    def encode_fragment(
+        self, key: str, value: Any, *, encoder: Encoder
+    ) -> tuple[str, Any]:
+        return key, self._to_builtin(value, encoder())
+
+    def join(self, fragments: list[tuple[str, Any]]) -> bytes:
+        return marshal.dumps(dict(fragments))
+
+    def decode(self, raw: bytes, *, object_hook: ObjectHook) -> dict[str, Any]:
+        data = marshal.loads(raw)
+        if object_hook is None:
+            return data
+        return self._hook(data, object_hook)
+
+    def __repr__(self) -> str:
+        return "<MarshalCodec>"
+
+
+class CompressedCodec(Codec):
+    """Compresses the output of another codec with :mod:`zlib` or :mod:`lzma`."""
+
+    def __init__(
+        self,
+        codec: Codec,
+        *,
+        compression: Literal["zlib", "lzma"] = "zlib",
+        level: Optional[int] = None,
+    ) -> None:
+        if compression not in ("zlib", "lzma"):
+            raise ValueError(f"Unknown compression: {compression!r}")
+
+        self.codec = codec
+        self.compression = compression
+        self.level = level
+
+    def encode_fragment(self, key: str, value: Any, *, encoder: Encoder) -> Any:
+        return self.codec.encode_fragment(key, value, encoder=encoder)
+
+    def join(self, fragments: list[Any]) -> bytes:
+        joined = self.codec.join(fragments)
+
+        if self.compression == "lzma":
+            return lzma.compress(joined, preset=self.level)
+        return zlib.compress(joined, -1 if self.level is None else self.level)
+
+    def decode(self, raw: bytes, *, object_hook: ObjectHook) -> dict[str, Any]:
+        if self.compression == "lzma":
+            decompressed = lzma.decompress(raw)
+        else:
+            decompressed = zlib.decompress(raw)
+
+        return self.codec.decode(decompressed, object_hook=object_hook)
+
+    def __repr__(self) -> str:
+        return (
+            f"<CompressedCodec codec={self.codec!r} compression={self.compression!r}>"
+        )
@@ -0,0 +1,1222 @@
+# encoding: utf-8
+
+__all__ = ("Storage",)
+
+import asyncio
+import bisect
+import contextlib
+import heapq
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import (
+    AsyncIterator,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Any,
+    Type,
+    Callable,
+)
+
+from typing_extensions import Self
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+from .base import VT, AsyncStorage
+from .codecs import Codec, JsonCodec
+
+log = logging.getLogger(__name__)
+
+_MISSING: Any = object()
+
+#: The default number of pending mutations that triggers an early flush when
+#: writing behind.
+DEFAULT_FLUSH_AFTER = 100
+
+#: The codec used by default, for compatibility with files written before
+#: codecs were configurable.
+DEFAULT_CODEC = JsonCodec(indent=2)
+
+#: The default size (in bytes) that a journal may grow to before it is
+#: compacted into the snapshot.
+DEFAULT_COMPACT_THRESHOLD = 1024 * 1024
+
+#: The number of writes whose changed keys are remembered for shared
+#: storages. Processes that fall further behind than this compare every key
+#: instead.
+GENERATION_HISTORY = 256
+
+#: The most keys that a write to a shared storage records as changed. Writes
+#: that change more are recorded as possibly changing anything, so the
+#: history stays small.
+GENERATION_MAX_KEYS = 64
+
+
+class SecondaryIndex:
+    """A mapping of what values are indexed under to the keys of those values.
+
+    See :meth:`Storage.create_index`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: Callable[[Any], Optional[Hashable]],
+        *,
+        persist: bool = False,
+    ) -> None:
+        self.name = name
+        self.key = key
+        self.persist = persist
+
+        #: What values are indexed under, to the keys of those values.
+        self.entries: dict[Hashable, set[str]] = {}
+
+        #: Keys to what their values are indexed under. Values can be mutated
+        #: in place, so this is needed to find their old entries.
+        self.values: dict[str, Hashable] = {}
+
+    def add(self, key: str, value: Any) -> None:
+        indexed = self.key(value)
+        if indexed is None:
+            return
+
+        self.values[key] = indexed
+        self.entries.setdefault(indexed, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        indexed = self.values.pop(key, _MISSING)
+        if indexed is _MISSING:
+            return
+
+        keys = self.entries[indexed]
+        keys.discard(key)
+        if not keys:
+            del self.entries[indexed]
+
+    def build(self, data: dict[str, Any]) -> None:
+        self.entries = {}
+        self.values = {}
+        for key, value in data.items():
+            self.add(key, value)
+
+    def restore(self, values: list[tuple[str, Any]]) -> None:
+        self.entries = {}
+        self.values = {}
+        for key, indexed in values:
+            # JSON turns tuples into lists
+            if isinstance(indexed, list):
+                indexed = _to_tuple(indexed)
+            self.values[key] = indexed
+            self.entries.setdefault(indexed, set()).add(key)
+
+    def __repr__(self) -> str:
+        return f"<SecondaryIndex name={self.name!r} persist={self.persist!r}>"
+
+
+def _to_tuple(value: list[Any]) -> tuple[Any, ...]:
+    return tuple(_to_tuple(item) if isinstance(item, list) else item for item in value)
+
+
+class Storage(AsyncStorage[VT]):
+    """Asynchronous data persistence to a JSON file.
+
+    Based off of RoboDanny's excellent config.py::
+
+        https://github.com/Rapptz/RoboDanny/blob/rewrite/cogs/utils/config.py
+
+    The file is pretty-printed JSON by default. Pass a :class:`Codec` as
+    ``codec`` to store it some other way, such as ``JsonCodec()`` for compact
+    JSON or ``CompressedCodec(MarshalCodec())`` for compressed binary data.
+    The write-ahead log is always JSON.
+
+    By default, every mutation rewrites the entire file. When ``journal`` is
+    ``True``, mutations are instead appended as single records to a write-ahead
+    log next to the file (``<file>.log``), so the cost of a write scales with
+    the size of the change rather than the size of the store. Once the log
+    grows past ``compact_threshold`` bytes, it is compacted into the snapshot
+    in the background. Both the snapshot and the log are replayed on load.
+
+    When ``flush_interval`` is set, mutations are written behind: they are
+    applied in memory immediately and persisted together at most once every
+    ``flush_interval`` seconds, or as soon as ``flush_after`` mutations are
+    pending. Pass ``durable=True`` to :meth:`put` or :meth:`delete` to wait
+    for the flush covering that mutation, and call :meth:`aclose` when you're
+    done with the storage.
+
+    Values put with a ``ttl`` expire after that many seconds. Expired keys are
+    treated as missing right away, and are deleted from the storage in batches
+    by a background task. Expiration times are kept next to the file
+    (``<file>.expiry``).
+
+    When ``shared`` is ``True``, many processes can use the same file at once.
+    Writes take an advisory lock on ``<file>.lock``, and merge the keys that
+    other processes changed into this instance instead of overwriting them.
+    A generation counter in ``<file>.gen`` is bumped by every write, and the
+    keys that recent writes changed are kept in ``<file>.changes``, so
+    :meth:`refresh` can cheaply pick up other processes' writes and reload
+    only the keys they touched. Shared storages can't be
+    journaled, and are only supported where :mod:`fcntl` is available.
+
+    When ``ordered`` is ``True``, a sorted list of keys is maintained, so
+    :meth:`scan` only visits the keys that it yields instead of sorting all
+    of them. This makes inserting and deleting keys slightly slower.
+
+    Values can be looked up by their contents through secondary indexes,
+    which are kept up to date as values are put and deleted. See
+    :meth:`create_index`.
+    """
+
+    def __init__(
+        self,
+        file: str,
+        *,
+        encoder: Type[json.JSONEncoder] = json.JSONEncoder,
+        object_hook: Optional[Callable[[dict[Any, Any]], Any]] = None,
+        journal: bool = False,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+        flush_interval: Optional[float] = None,
+        flush_after: int = DEFAULT_FLUSH_AFTER,
+        codec: Codec = DEFAULT_CODEC,
+        shared: bool = False,
+        ordered: bool = False,
+    ) -> None:
+        if shared and journal:
+            raise ValueError("Shared storages can't be journaled")
+
+        if shared and fcntl is None:
+            raise RuntimeError("Shared storages aren't supported on this platform")
+
+        super().__init__()
+        self.file = file
+        self._data: dict[str, Any] = {}
+        self.lock = asyncio.Lock()
+        self.object_hook = object_hook
+        self.encoder = encoder
+
+        #: The :class:`Codec` used to encode the file.
+        self.codec = codec
+
+        #: Whether mutations are appended to a write-ahead log.
+        self.journal = journal
+
+        #: The path to the write-ahead log.
+        self.journal_file = f"{file}.log"
+
+        #: The size (in bytes) that the write-ahead log may grow to before
+        #: being compacted.
+        self.compact_threshold = compact_threshold
+
+        #: The maximum number of seconds that mutations are buffered in memory
+        #: before being persisted, or ``None`` to persist them immediately.
+        self.flush_interval = flush_interval
+
+        #: The number of pending mutations that triggers an early flush.
+        self.flush_after = flush_after
+
+        self._journal_size = 0
+        self._compaction_task: Optional[asyncio.Task[None]] = None
+
+        # the encoded records waiting to be appended to the log. only the
+        # latest record of each key needs to be written.
+        self._pending: dict[str, str] = {}
+        self._pending_count = 0
+        self._waiter: Optional[asyncio.Future[None]] = None
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+
+        self._fragments: dict[str, Any] = {}
+        self._dirty: set[str] = set()
+
+        # the values and expiration times of keys before they were touched in
+        # the current batch
+        self._batch: Optional[dict[str, tuple[Any, Optional[float]]]] = None
+
+        #: The path to the file holding expiration times.
+        self.expiry_file = f"{file}.expiry"
+
+        # keys to the UNIX timestamps they expire at, and a min-heap of the same
+        # for the sweeper. the heap may contain stale entries, which are skipped.
+        self._expiry: dict[str, float] = {}
+        self._expiry_heap: list[tuple[float, str]] = []
+
+        # keys that have expired but haven't been deleted yet. keys are moved
+        # here from the heap as their deadlines pass.
+        self._lapsed: set[str] = set()
+        self._expiry_changed = False
+        self._sweeper: Optional[asyncio.Task[None]] = None
+        self._sweeper_wakeup = asyncio.Event()
+
+        self._indexes: dict[str, SecondaryIndex] = {}
+
+        # the snapshot's size and modification time when it was loaded, and
+        # the keys that the log touched on top of it
+        self._loaded_snapshot: Optional[list[int]] = None
+        self._replayed: set[str] = set()
+
+        # whether the data is still exactly what was loaded
+        self._pristine = True
+
+        #: Whether this storage is shared with other processes.
+        self.shared = shared
+
+        #: The path to the file that is locked while writing a shared storage.
+        self.lock_file = f"{file}.lock"
+
+        #: The path to the file holding the generation counter of a shared
+        #: storage.
+        self.generation_file = f"{file}.gen"
+
+        #: The path to the file holding the keys that recent generations of a
+        #: shared storage changed.
+        self.changes_file = f"{file}.changes"
+
+        # the generation of the file that we have last seen
+        self._generation = 0
+
+        #: Whether a sorted list of keys is maintained for :meth:`scan`.
+        self.ordered = ordered
+        self._sorted_keys: list[str] = []
+
+        self._load()
+        self._start_sweeper()
+
+    def _write_snapshot(self, encoded: bytes, file: Optional[str] = None) -> None:
+        with tempfile.NamedTemporaryFile(
+            mode="wb",
+            suffix=".tmp",
+            dir=os.path.dirname(os.path.abspath(self.file)),
+            delete=False,
+        ) as temporary_destination:
+            temporary_destination.write(encoded)
+
+        os.replace(temporary_destination.name, file or self.file)
+
+    def _encode(self, data: dict[str, Any], dirty: Optional[set[str]]) -> bytes:
+        """Encode the data with the codec.
+
+        The encoded fragment of every key is cached, so only the keys in
+        ``dirty`` (or all of them, if ``dirty`` is ``None``) are encoded again.
+        """
+        if dirty is None:
+            self._fragments.clear()
+        else:
+            for key in dirty:
+                self._fragments.pop(key, None)
+
+        fragments = []
+        for key, value in data.items():
+            try:
+                fragment = self._fragments[key]
+            except KeyError:
+                fragment = self._fragments[key] = self.codec.encode_fragment(
+                    key, value, encoder=self.encoder
+                )
+            fragments.append(fragment)
+
+        return self.codec.join(fragments)
+
+    def _save(
+        self,
+        data: dict[str, Any],
+        dirty: Optional[set[str]] = None,
+        expiry: Optional[dict[str, float]] = None,
+        indexes: Optional[dict[str, list[tuple[str, Any]]]] = None,
+    ) -> None:
+        # encoded up front, so that an index that can't be persisted doesn't
+        # stop the snapshot and everything after it from being written
+        encoded_indexes = {}
+        for name, values in (indexes or {}).items():
+            try:
+                encoded_indexes[name] = json.dumps(values)
+            except (TypeError, ValueError):
+                log.warning(
+                    "Not persisting index %r of %r, it indexes values that "
+                    "can't be encoded as JSON.",
+                    name,
+                    self,
+                    exc_info=True,
+                )
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._index_file(name))
+
+        self._write_snapshot(self._encode(data, dirty))
+
+        if encoded_indexes:
+            # tie the indexes to this exact snapshot, so they are only reused
+            # if nothing has changed it since
+            stat = os.stat(self.file)
+            snapshot = json.dumps([stat.st_size, stat.st_mtime_ns])
+            for name, encoded in encoded_indexes.items():
+                self._write_snapshot(
+                    f'{{"snapshot": {snapshot}, "values": {encoded}}}'.encode(),
+                    self._index_file(name),
+                )
+
+        if expiry is not None:
+            if expiry:
+                self._write_snapshot(json.dumps(expiry).encode(), self.expiry_file)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.expiry_file)
+
+        if self.journal:
+            # everything in the log is now contained in the snapshot. if we
+            # crash before truncating, replaying the log again is harmless.
+            with open(self.journal_file, "w", encoding="utf-8"):
+                pass
+            self._journal_size = 0
+
+    def _append(self, records: list[str]) -> None:
+        with open(self.journal_file, "a", encoding="utf-8") as fp:
+            fp.writelines(records)
+            self._journal_size = fp.tell()
+
+    def _encode_record(self, *record: Any) -> str:
+        return json.dumps(record, cls=self.encoder) + "\n"
+
+    def _replay(self) -> None:
+        try:
+            fp = open(self.journal_file, "rb+")
+        except FileNotFoundError:
+            self._journal_size = 0
+            return
+
+        with fp:
+            offset = 0
+
+            for line in fp:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated record")
+                    op, key, *value = json.loads(line, object_hook=self.object_hook)
+                except ValueError:
+                    # a torn write at the end of the log, from crashing while
+                    # appending. everything before it is intact, so cut it off
+                    # before anything else gets appended after it.
+                    fp.truncate(offset)
+                    break
+
+                offset += len(line)
+
+                self._replayed.add(key)
+
+                if op == "put":
+                    self._data[key] = value[0]
+                    if len(value) > 1:
+                        self._expiry[key] = value[1]
+                    else:
+                        self._expiry.pop(key, None)
+                else:
+                    self._data.pop(key, None)
+                    self._expiry.pop(key, None)
+
+            self._journal_size = offset
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.lock_file, "a") as fp:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.generation_file, "rb") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return 0
+
+    def _read_history(self) -> list[list[Any]]:
+        try:
+            with open(self.changes_file, "rb") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return []
+
+    def _read_remote(
+        self, data: dict[str, Any], expiry: dict[str, float]
+    ) -> tuple[int, list[list[Any]], dict[str, Any], dict[str, Optional[float]]]:
+        """Read the values and expiration times of the keys that other
+        processes changed since we last saw the file.
+
+        Must be called with the file lock held. Deleted keys are returned as
+        ``_MISSING``.
+        """
+        generation = self._read_generation()
+        history = self._read_history()
+        if generation == self._generation:
+            return generation, history, {}, {}
+
+        try:
+            with open(self.file, "rb") as fp:
+                remote = self.codec.decode(fp.read(), object_hook=self.object_hook)
+        except FileNotFoundError:
+            remote = {}
+
+        try:
+            with open(self.expiry_file, "rb") as fp:
+                remote_expiry = json.load(fp)
+        except FileNotFoundError:
+            remote_expiry = {}
+
+        changed: Optional[set[str]] = set()
+        if not history or history[0][0] > self._generation + 1:
+            # we've fallen behind further than the history goes
+            changed = None
+        else:
+            for written, keys in history:
+                if written <= self._generation:
+                    continue
+                if keys is None:
+                    # a full save, which might have changed anything
+                    changed = None
+                    break
+                changed.update(keys)
+
+        if changed is None:
+            changed = {
+                key
+                for key in remote.keys() | data.keys()
+                if remote.get(key, _MISSING) != data.get(key, _MISSING)
+                or remote_expiry.get(key) != expiry.get(key)
+            }
+
+        changes = {key: remote.get(key, _MISSING) for key in changed}
+        deadlines = {key: remote_expiry.get(key) for key in changed}
+        return generation, history, changes, deadlines
+
+    def _sync(
+        self,
+        data: dict[str, Any],
+        mutated: set[str],
+        expiry: dict[str, float],
+        *,
+        full: bool = False,
+    ) -> tuple[int, dict[str, Any], dict[str, Optional[float]]]:
+        """Merge other processes' changes into the data and save it."""
+        with self._file_lock():
+            generation, history, changes, deadlines = self._read_remote(data, expiry)
+
+            # our own mutations take precedence
+            for key in mutated:
+                changes.pop(key, None)
+                deadlines.pop(key, None)
+
+            for key, value in changes.items():
+                if value is _MISSING:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+
+                deadline = deadlines[key]
+                if deadline is None:
+                    expiry.pop(key, None)
+                else:
+                    expiry[key] = deadline
+
+            self._save(data, None if full else mutated | changes.keys(), expiry)
+
+            generation += 1
+            if full or len(mutated) > GENERATION_MAX_KEYS:
+                history.append([generation, None])
+            else:
+                history.append([generation, sorted(mutated)])
+            del history[:-GENERATION_HISTORY]
+            self._write_snapshot(json.dumps(history).encode(), self.changes_file)
+            # written last, so that the history is there once it's noticed
+            self._write_snapshot(json.dumps(generation).encode(), self.generation_file)
+
+        return generation, changes, deadlines
+
+    def _fetch_remote(
+        self, data: dict[str, Any], expiry: dict[str, float]
+    ) -> tuple[int, dict[str, Any], dict[str, Optional[float]]]:
+        with self._file_lock():
+            generation, _, changes, deadlines = self._read_remote(data, expiry)
+        return generation, changes, deadlines
+
+    def _merge(
+        self,
+        generation: int,
+        changes: dict[str, Any],
+        deadlines: dict[str, Optional[float]],
+    ) -> None:
+        self._generation = generation
+
+        for key, value in changes.items():
+            if key in self._dirty or (self._batch is not None and key in self._batch):
+                # mutated again in the meantime. ours wins once it's written.
+                continue
+
+            if value is not _MISSING:
+                self._set(key, value, deadlines[key])
+            elif key in self._data:
+                self._unset(key)
+
+    async def refresh(self) -> bool:
+        """Reload the keys that other processes have changed since this
+        storage last saw the file.
+
+        Only the small generation file is read unless something has changed.
+        Keys with mutations that haven't been written yet keep their values.
+        Returns whether anything had changed.
+        """
+        if not self.shared:
+            raise RuntimeError("Only shared storages can be refreshed")
+
+        async with self.lock:
+            generation = await asyncio.to_thread(self._read_generation)
+            if generation == self._generation:
+                return False
+
+            synced = await asyncio.to_thread(
+                self._fetch_remote, self._data.copy(), self._expiry.copy()
+            )
+            self._merge(*synced)
+            return True
+
+    def _load(self) -> None:
+        self._fragments.clear()
+        self._replayed = set()
+
+        if self.shared:
+            # the generation is written after the snapshot, so reading it
+            # first can only make us reload changes that we already have
+            self._generation = self._read_generation()
+
+        try:
+            with open(self.expiry_file, "rb") as fp:
+                self._expiry = json.load(fp)
+        except FileNotFoundError:
+            self._expiry = {}
+
+        try:
+            with open(self.file, "rb") as fp:
+                stat = os.fstat(fp.fileno())
+                self._loaded_snapshot = [stat.st_size, stat.st_mtime_ns]
+                self._data = self.codec.decode(fp.read(), object_hook=self.object_hook)
+        except FileNotFoundError:
+            self._loaded_snapshot = None
+            self._data = {}
+
+        if self.journal:
+            self._replay()
+
+        # the snapshot might have been written without its expiration times
+        self._expiry = {
+            key: deadline for key, deadline in self._expiry.items() if key in self._data
+        }
+        self._expiry_heap = [(deadline, key) for key, deadline in self._expiry.items()]
+        heapq.heapify(self._expiry_heap)
+        self._lapsed = set()
+
+        self._pristine = True
+        for index in self._indexes.values():
+            index.build(self._data)
+
+        if self.ordered:
+            self._sorted_keys = sorted(self._data)
+
+    def _maybe_compact(self) -> None:
+        if self._journal_size > self.compact_threshold and (
+            self._compaction_task is None or self._compaction_task.done()
+        ):
+            self._compaction_task = asyncio.create_task(self._snapshot())
+
+    def _start_flush(self) -> None:
+        self._flush_timer = None
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: "asyncio.Task[None]") -> None:
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Failed to flush %r.", self, exc_info=task.exception())
+
+    def _remember(self, key: str) -> None:
+        if self._batch is None:
+            return
+
+        if self._batching():
+            if key not in self._batch:
+                self._batch[key] = (
+                    self._data.get(key, _MISSING),
+                    self._expiry.get(key),
+                )
+        else:
+            # another task took the key over, so the batch can't roll it back
+            self._batch.pop(key, None)
+
+    def _set(self, key: str, value: Any, deadline: Optional[float] = None) -> None:
+        self._remember(key)
+        if self._watchers:
+            self._notify("put", key, self._data.get(key), value)
+        if self.ordered and key not in self._data:
+            bisect.insort(self._sorted_keys, key)
+        self._data[key] = value
+        self._expire(key, deadline)
+        self._pristine = False
+
+        for index in self._indexes.values():
+            index.remove(key)
+            index.add(key, value)
+
+    def _unset(self, key: str) -> None:
+        self._remember(key)
+        if self._watchers:
+            self._notify("delete", key, self._data[key], None)
+        del self._data[key]
+        if self.ordered:
+            del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key)]
+        self._expire(key, None)
+        self._pristine = False
+
+        for index in self._indexes.values():
+            index.remove(key)
+
+    def _put_record(self, key: str) -> tuple[Any, ...]:
+        deadline = self._expiry.get(key)
+        if deadline is None:
+            return ("put", key, self._data[key])
+        return ("put", key, self._data[key], deadline)
+
+    def _expire(self, key: str, deadline: Optional[float]) -> None:
+        self._lapsed.discard(key)
+
+        if deadline is None:
+            if self._expiry.pop(key, None) is not None:
+                self._expiry_changed = True
+            return
+
+        self._expiry[key] = deadline
+        self._expiry_changed = True
+
+        if self._expiry_heap and deadline < self._expiry_heap[0][0]:
+            # the sweeper is sleeping until a later deadline
+            self._sweeper_wakeup.set()
+        heapq.heappush(self._expiry_heap, (deadline, key))
+
+        if len(self._expiry_heap) > 2 * len(self._expiry) + 64:
+            # too many stale entries from keys that were put again
+            self._expiry_heap = [
+                (deadline, key)
+                for key, deadline in self._expiry.items()
+                if key not in self._lapsed
+            ]
+            heapq.heapify(self._expiry_heap)
+
+    def _expired(self, key: Any) -> bool:
+        deadline = self._expiry.get(key)
+        return deadline is not None and deadline <= time.time()
+
+    def _advance(self) -> None:
+        """Move the keys whose deadlines have passed into ``_lapsed``."""
+        heap = self._expiry_heap
+        now = time.time()
+        if not heap or heap[0][0] > now:
+            return
+
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            if self._expiry.get(key) == deadline:
+                self._lapsed.add(key)
+
+        # they might have been loaded without anything starting the sweeper
+        self._start_sweeper()
+
+    def _start_sweeper(self) -> None:
+        if not self._expiry or (self._sweeper is not None and not self._sweeper.done()):
+            return
+
+        try:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep())
+        except RuntimeError:
+            # not running in an event loop yet, so wait for the next chance
+            pass
+
+    async def _sweep(self) -> None:
+        # expired keys are deleted right away, even if a batch started us
+        self._leave_batches()
+
+        while self._expiry:
+            self._advance()
+
+            if self._lapsed:
+                await self.delete_many(list(self._lapsed))
+                continue
+
+            heap = self._expiry_heap
+            delay = heap[0][0] - time.time() if heap else None
+            self._sweeper_wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._sweeper_wakeup.wait(), delay)
+
+    async def _commit(
+        self, records: list[tuple[Any, ...]], *, durable: bool = False
+    ) -> None:
+        if self._batching():
+            # written all at once when the batch ends
+            return
+
+        self._start_sweeper()
+
+        for record in records:
+            self._dirty.add(record[1])
+            if self.journal:
+                self._pending.pop(record[1], None)
+                self._pending[record[1]] = self._encode_record(*record)
+        self._pending_count += len(records)
+
+        if self.flush_interval is None:
+            await self.flush()
+            return
+
+        if self._pending_count >= self.flush_after:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._start_flush()
+        elif self._flush_timer is None:
+            loop = asyncio.get_running_loop()
+            self._flush_timer = loop.call_later(self.flush_interval, self._start_flush)
+
+        if durable:
+            if self._waiter is None:
+                self._waiter = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._waiter)
+
+    async def flush(self) -> None:
+        """Persist all pending mutations to disk."""
+        if not self._pending_count:
+            return
+
+        waiter, self._waiter = self._waiter, None
+        records, self._pending = self._pending, {}
+        count, self._pending_count = self._pending_count, 0
+
+        try:
+            async with self.lock:
+                if self.journal:
+                    await asyncio.to_thread(self._append, list(records.values()))
+                else:
+                    await self._save_dirty()
+        except BaseException as exc:
+            # keep the mutations around so the next flush can try again.
+            self._pending = {**records, **self._pending}
+            self._pending_count += count
+            if waiter is not None:
+                waiter.set_exception(exc)
+            raise
+        else:
+            if waiter is not None:
+                waiter.set_result(None)
+
+        if self.journal:
+            self._maybe_compact()
+
+    async def aclose(self) -> None:
+        """Flush all pending mutations and wait for background work to finish.
+
+        Call this when you're done with the storage, such as in
+        ``cog_unload``, so no buffered writes are lost.
+        """
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper
+
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+        await self.flush()
+
+        if self._compaction_task is not None:
+            await self._compaction_task
+
+    def _committed(self) -> tuple[dict[str, Any], dict[str, float]]:
+        """Copy the data and expiration times to be written, without the
+        mutations of the current batch, which are only persisted once it ends.
+        """
+        data = self._data.copy()
+        expiry = self._expiry.copy()
+
+        for key, (previous, deadline) in (self._batch or {}).items():
+            if previous is _MISSING:
+                data.pop(key, None)
+            else:
+                data[key] = previous
+
+            if deadline is None:
+                expiry.pop(key, None)
+            else:
+                expiry[key] = deadline
+
+        return data, expiry
+
+    def _take_expiry(self, expiry: dict[str, float]) -> Optional[dict[str, float]]:
+        if not self._expiry_changed and not (self.journal and expiry):
+            return None
+
+        # when journaling, the log holds the expiration times until it's
+        # compacted, so they have to be written along with the snapshot.
+        self._expiry_changed = False
+        return expiry
+
+    def _take_indexes(self) -> dict[str, list[tuple[str, Any]]]:
+        if self.shared or self._batch is not None:
+            # other processes' changes would be missing from them, or the
+            # batch's would be included
+            return {}
+
+        return {
+            name: list(index.values.items())
+            for name, index in self._indexes.items()
+            if index.persist
+        }
+
+    async def _save_dirty(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        data, expiry = self._committed()
+
+        try:
+            if self.shared:
+                synced = await asyncio.to_thread(self._sync, data, dirty, expiry)
+                self._merge(*synced)
+                return
+
+            await asyncio.to_thread(
+                self._save,
+                data,
+                dirty,
+                self._take_expiry(expiry),
+                self._take_indexes(),
+            )
+        except BaseException:
+            # their cached fragments are stale until they're written
+            self._dirty |= dirty
+            raise
+
+    async def _snapshot(self) -> None:
+        async with self.lock:
+            await self._save_dirty()
+
+    async def save(self) -> None:
+        """Serialize the in-memory data and atomatically save it to disk.
+
+        Unlike the saves that happen after :meth:`put` and :meth:`delete`,
+        every value is encoded again, so this also picks up values that were
+        mutated in place. When journaling, this compacts the write-ahead log
+        into the snapshot.
+        """
+        async with self.lock:
+            data, expiry = self._committed()
+
+            if self.shared:
+                dirty, self._dirty = self._dirty, set()
+                synced = await asyncio.to_thread(
+                    self._sync, data, dirty, expiry, full=True
+                )
+                self._merge(*synced)
+                return
+
+            self._dirty.clear()
+            self._expiry_changed = True
+            await asyncio.to_thread(
+                self._save,
+                data,
+                None,
+                self._take_expiry(expiry),
+                self._take_indexes(),
+            )
+
+    async def load(self) -> None:
+        """Read the corresponding JSON file from disk and deserialize it (if it exists)."""
+        async with self.lock:
+            await asyncio.to_thread(self._load)
+        self._start_sweeper()
+
+    async def put(
+        self,
+        key: str,
+        value: VT,
+        *,
+        ttl: Optional[float] = None,
+        durable: bool = False,
+    ) -> None:
+        """Insert a value into storage and persist it.
+
+        If ``ttl`` is given, the value expires after that many seconds.
+        Otherwise, any expiration time the key had is cleared.
+
+        When writing behind, this returns before the value reaches the disk
+        unless ``durable`` is ``True``.
+        """
+        self._set(key, value, None if ttl is None else time.time() + ttl)
+        await self._commit([self._put_record(key)], durable=durable)
+
+    async def delete(self, key: str, *, durable: bool = False) -> None:
+        """Remove a value from storage and persist the removal.
+
+        When writing behind, this returns before the removal reaches the disk
+        unless ``durable`` is ``True``.
+        """
+        self._unset(key)
+        await self._commit([("del", key)], durable=durable)
+
+    async def put_many(
+        self,
+        items: Mapping[str, VT] | Iterable[tuple[str, VT]],
+        *,
+        durable: bool = False,
+    ) -> None:
+        """Insert many values into storage and persist them in a single write."""
+        items = dict(items)
+
+        for key, value in items.items():
+            self._set(key, value)
+
+        await self._commit(
+            [("put", key, value) for key, value in items.items()], durable=durable
+        )
+
+    async def delete_many(self, keys: Iterable[str], *, durable: bool = False) -> None:
+        """Remove many values from storage and persist the removals in a single
+        write.
+
+        If any of the keys are missing, nothing is removed.
+        """
+        keys = list(dict.fromkeys(keys))
+
+        for key in keys:
+            if key not in self._data:
+                raise KeyError(key)
+
+        for key in keys:
+            self._unset(key)
+
+        await self._commit([("del", key) for key in keys], durable=durable)
+
+    @contextlib.asynccontextmanager
+    async def batch(self, *, durable: bool = False) -> AsyncIterator[Self]:
+        """Group mutations so that they are persisted in a single write.
+
+        Mutations made inside the ``async with`` block are applied in memory
+        right away, but are only persisted once the block exits, even if the
+        storage is saved in the meantime. If the block raises an exception,
+        they are all rolled back instead.
+
+        Only the mutations of the task that opened the batch (and the tasks it
+        starts) are part of it. Other tasks' mutations are persisted as usual
+        and are never rolled back, and their batches wait for this one to
+        end. Nested batches are part of the outermost one.
+
+        .. code:: python3
+
+            async with storage.batch():
+                for guild_id in guild_ids:
+                    await storage.delete(f"guild:{guild_id}")
+        """
+        if self._batching():
+            yield self
+            return
+
+        async with self._open_batch():
+            self._batch = {}
+
+            try:
+                yield self
+            except BaseException:
+                batch, self._batch = self._batch, None
+
+                for key, (previous, deadline) in batch.items():
+                    if previous is not _MISSING:
+                        self._set(key, previous, deadline)
+                    elif key in self._data:
+                        self._unset(key)
+                raise
+
+            batch, self._batch = self._batch, None
+
+        if batch:
+            # a save in the meantime would have written the old ones
+            self._expiry_changed = True
+
+        records: list[tuple[Any, ...]] = [
+            self._put_record(key) if key in self._data else ("del", key)
+            for key in batch
+        ]
+        if records:
+            await self._commit(records, durable=durable)
+
+    def _index_file(self, name: str) -> str:
+        return f"{self.file}.index.{name}"
+
+    def _restore_index(self, index: SecondaryIndex) -> bool:
+        if self.shared or not self._pristine or self._loaded_snapshot is None:
+            # the data has changed since it was loaded
+            return False
+
+        try:
+            with open(self._index_file(index.name), "rb") as fp:
+                persisted = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        if persisted["snapshot"] != self._loaded_snapshot:
+            return False
+
+        index.restore(persisted["values"])
+
+        for key in self._replayed:
+            index.remove(key)
+            if key in self._data:
+                index.add(key, self._data[key])
+
+        return True
+
+    def create_index(
+        self,
+        name: str,
+        key: Callable[[VT], Optional[Hashable]],
+        *,
+        persist: bool = False,
+    ) -> None:
+        """Create a secondary index over the values in storage.
+
+        ``key`` is called with every value to determine what to index it
+        under. Values that it returns ``None`` for aren't indexed. Use
+        :meth:`find` to look up values by what they were indexed under:
+
+        .. code:: python3
+
+            tags.create_index("owner", key=lambda tag: tag["owner_id"])
+            owned_tags = tags.find("owner", ctx.author.id)
+
+        Indexes are kept up to date as values are put and deleted. Values that
+        are mutated in place must be put again for their index entries to
+        change.
+
+        If ``persist`` is ``True``, the index is saved next to the file
+        (``<file>.index.<name>``) along with the snapshot, and it is restored
+        from there instead of being rebuilt when possible. Persisted indexes
+        can only index strings, numbers, booleans and tuples of them. Other
+        values are still indexed, but the index isn't saved, and a warning is
+        logged instead. Indexes of shared storages are never persisted.
+        """
+        if name in self._indexes:
+            raise ValueError(f"An index named {name!r} already exists")
+
+        index = SecondaryIndex(name, key, persist=persist)
+        if not (persist and self._restore_index(index)):
+            index.build(self._data)
+        self._indexes[name] = index
+
+    def drop_index(self, name: str) -> None:
+        """Remove a secondary index created with :meth:`create_index`."""
+        index = self._indexes.pop(name)
+        if index.persist:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._index_file(name))
+
+    def find(self, index: str, value: Hashable) -> dict[str, VT]:
+        """Look up all values that an index has indexed under ``value``."""
+        keys = self._indexes[index].entries.get(value, ())
+        return {key: self._data[key] for key in keys if key in self}
+
+    async def scan(
+        self,
+        prefix: str = "",
+        *,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[tuple[str, VT]]:
+        """Iterate over keys and their values in the order of the keys.
+
+        See :meth:`AsyncStorage.scan`. When the storage is ``ordered``, this
+        takes ``O(log n + k)`` time to find the ``k`` matching keys.
+        """
+        if not self.ordered:
+            async for item in super().scan(prefix, start=start, end=end, limit=limit):
+                yield item
+            return
+
+        if limit is not None and limit <= 0:
+            return
+
+        keys = self._sorted_keys
+        lower = prefix if start is None else max(prefix, start)
+
+        # collect the matching keys up front, since the list can change while
+        # the caller is suspended
+        matching = []
+        for position in range(bisect.bisect_left(keys, lower), len(keys)):
+            key = keys[position]
+            if not key.startswith(prefix) or (end is not None and key >= end):
+                break
+            if self._expiry and self._expired(key):
+                continue
+
+            matching.append(key)
+            if limit is not None and len(matching) >= limit:
+                break
+
+        for key in matching:
+            try:
+                value = self[key]
+            except KeyError:
+                # deleted in the meantime
+                continue
+            yield key, value
+
+    def get(self, key: str, default: Optional[VT] = None) -> VT:
+        if self._expiry and self._expired(key):
+            return default  # type: ignore
+        return self._data.get(key, default)
+
+    def all(self):
+        """Return the underlying dict of data.
+
+        It may contain expired keys that haven't been deleted yet.
+        """
+        return self._data
+
+    def __iter__(self) -> Iterator[str]:
+        self._advance()
+        if self._lapsed:
+            lapsed = self._lapsed.copy()
+            return (key for key in self._data if key not in lapsed)
+        return iter(self._data)
+
+    def __contains__(self, key: Any) -> bool:
+        key = str(key)
+        if self._expiry and self._expired(key):
+            return False
+        return key in self._data
+
+    def __getitem__(self, key: str) -> Any:
+        if self._expiry and self._expired(key):
+            raise KeyError(key)
+        return self._data[key]
+
+    def __len__(self) -> int:
+        self._advance()
+        return len(self._data) - len(self._lapsed)
+
+    def __repr__(self) -> str:
+        return f"<Storage file={self.file!r}>"
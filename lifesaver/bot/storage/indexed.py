@@ -0,0 +1,518 @@
+# encoding: utf-8
+
+__all__ = ("IndexedStorage", "CacheInfo")
+
+import asyncio
+import contextlib
+import json
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from typing import (
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Any,
+    Type,
+    Callable,
+    NamedTuple,
+)
+
+from typing_extensions import Self
+
+from .base import VT, AsyncStorage
+
+#: The default number of bytes of decoded values kept in memory.
+DEFAULT_CACHE_SIZE = 32 * 1024 * 1024
+
+#: Marks a key whose deletion hasn't been written to the index yet.
+_DELETED: Any = object()
+
+#: Marks a key that had no unwritten mutation before a batch touched it.
+_MISSING: Any = object()
+
+#: The smallest segment that is considered for compaction.
+MIN_COMPACTION_SIZE = 1024 * 1024
+
+
+class Region(NamedTuple):
+    """The location of an encoded value in a segment."""
+
+    offset: int
+    length: int
+
+
+class CacheInfo(NamedTuple):
+    """Statistics about the values that :class:`IndexedStorage` keeps in memory."""
+
+    #: The number of lookups that were answered from memory.
+    hits: int
+    #: The number of lookups that had to read the value from the segment.
+    misses: int
+    #: The number of values that were evicted from memory.
+    evictions: int
+    #: The number of values currently kept in memory.
+    keys: int
+    #: The number of bytes of values currently kept in memory, measured by the
+    #: size of their encoded form.
+    size: int
+
+
+class IndexedStorage(AsyncStorage[VT]):
+    """Asynchronous data persistence that doesn't keep values in memory.
+
+    Values are appended as JSON to a segment file (``<file>.<n>``), and
+    ``file`` holds an append-only index of keys to the regions of the segment
+    that hold their values. Only the index is read when loading, so loading
+    takes the same time regardless of how much data is stored. The segment is
+    memory-mapped, and values are decoded when they are first accessed. At
+    most ``cache_size`` bytes (and, if set, ``max_keys`` keys) of decoded
+    values are kept around, evicting the least recently used ones first.
+    Evicted values stay on disk and are read back transparently when they
+    are accessed again. Use :meth:`cache_info` to see how well the cache is
+    sized.
+
+    It can stand in for :class:`Storage` when keeping every value in memory
+    is too expensive, as long as only the mapping methods, :meth:`put`,
+    :meth:`delete`, their bulk versions and :meth:`batch` are used. There is
+    no :meth:`~Storage.all`, :meth:`~Storage.save`, :meth:`~Storage.load`,
+    expiration, or ``durable`` flag.
+
+    Overwritten and deleted values are left behind in the segment until more
+    than half of it is garbage, at which point the live values are copied to
+    a new segment in the background.
+    """
+
+    def __init__(
+        self,
+        file: str,
+        *,
+        encoder: Type[json.JSONEncoder] = json.JSONEncoder,
+        object_hook: Optional[Callable[[dict[Any, Any]], Any]] = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        max_keys: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+        self.file = file
+        self.encoder = encoder
+        self.object_hook = object_hook
+        self.lock = asyncio.Lock()
+
+        #: The maximum number of bytes of decoded values to keep in memory,
+        #: measured by the size of their encoded form.
+        self.cache_size = cache_size
+
+        #: The maximum number of decoded values to keep in memory, or ``None``
+        #: for no limit.
+        self.max_keys = max_keys
+
+        self._index: dict[str, Region] = {}
+        self._segment = 0
+        self._segment_size = 0
+        self._garbage = 0
+        self._map: Optional[mmap.mmap] = None
+
+        self._cache: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._cached_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        # mutations that haven't been written to the index yet
+        self._unwritten: dict[str, Any] = {}
+
+        # the mutations made in the current batch, and what the keys had in
+        # _unwritten before the batch touched them
+        self._batch: Optional[dict[str, tuple[Any, Optional[bytes]]]] = None
+        self._batch_unwritten: dict[str, Any] = {}
+
+        self._compaction_task: Optional[asyncio.Task[None]] = None
+
+        self._load()
+
+    @property
+    def segment_file(self) -> str:
+        """The path to the current segment."""
+        return f"{self.file}.{self._segment}"
+
+    def _load(self) -> None:
+        self._index = {}
+        self._segment = 0
+
+        try:
+            fp = open(self.file, "rb+")
+        except FileNotFoundError:
+            self._write_index(self._segment, self._index)
+        else:
+            with fp:
+                header = fp.readline()
+                self._segment = json.loads(header)["segment"]
+                offset = len(header)
+
+                for line in fp:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        key, *region = json.loads(line)
+                    except ValueError:
+                        # a torn write from crashing while appending
+                        fp.truncate(offset)
+                        break
+
+                    offset += len(line)
+
+                    if region:
+                        self._index[key] = Region(*region)
+                    else:
+                        self._index.pop(key, None)
+
+        try:
+            self._segment_size = os.path.getsize(self.segment_file)
+        except FileNotFoundError:
+            self._segment_size = 0
+
+        self._garbage = self._segment_size - sum(
+            region.length for region in self._index.values()
+        )
+        self._remap()
+
+    def _write_index(self, segment: int, index: dict[str, Region]) -> None:
+        lines = [json.dumps({"segment": segment}) + "\n"]
+        lines.extend(json.dumps([key, *region]) + "\n" for key, region in index.items())
+
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            suffix=".tmp",
+            dir=os.path.dirname(os.path.abspath(self.file)),
+            delete=False,
+        ) as temporary_destination:
+            temporary_destination.writelines(lines)
+
+        os.replace(temporary_destination.name, self.file)
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        if not self._segment_size:
+            # empty files can't be mapped
+            return
+
+        with open(self.segment_file, "rb") as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read(self, region: Region) -> Any:
+        if self._map is None or region.offset + region.length > len(self._map):
+            # the segment has grown since we mapped it
+            self._remap()
+        assert self._map is not None
+
+        raw = self._map[region.offset : region.offset + region.length]
+        return json.loads(raw, object_hook=self.object_hook)
+
+    def _cache_value(self, key: str, value: Any, size: int) -> None:
+        previous = self._cache.pop(key, None)
+        if previous is not None:
+            self._cached_bytes -= previous[1]
+
+        self._cache[key] = (value, size)
+        self._cached_bytes += size
+
+        while len(self._cache) > 1 and (
+            self._cached_bytes > self.cache_size
+            or (self.max_keys is not None and len(self._cache) > self.max_keys)
+        ):
+            _, (_, evicted_size) = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted_size
+            self._evictions += 1
+
+    def _uncache(self, key: str) -> None:
+        previous = self._cache.pop(key, None)
+        if previous is not None:
+            self._cached_bytes -= previous[1]
+
+    def cache_info(self) -> CacheInfo:
+        """Return statistics about the values kept in memory."""
+        return CacheInfo(
+            self._hits,
+            self._misses,
+            self._evictions,
+            len(self._cache),
+            self._cached_bytes,
+        )
+
+    def _append(self, records: list[tuple[str, Optional[bytes]]]) -> list[Region]:
+        regions = []
+
+        with open(self.segment_file, "ab") as fp:
+            # where the file actually ends, in case an earlier write failed
+            # partway through
+            offset = fp.seek(0, os.SEEK_END)
+            for _, encoded in records:
+                if encoded is None:
+                    continue
+                fp.write(encoded)
+                regions.append(Region(offset, len(encoded)))
+                offset += len(encoded)
+
+        lines = []
+        written = iter(regions)
+        for key, encoded in records:
+            if encoded is None:
+                lines.append(json.dumps([key]) + "\n")
+            else:
+                lines.append(json.dumps([key, *next(written)]) + "\n")
+
+        # the values must hit the segment before the index points to them
+        with open(self.file, "a", encoding="utf-8") as fp:
+            fp.writelines(lines)
+
+        self._segment_size = offset
+        return regions
+
+    def _compact(self, index: dict[str, Region]) -> tuple[int, dict[str, Region]]:
+        segment = self._segment + 1
+        compacted: dict[str, Region] = {}
+        offset = 0
+
+        with open(self.segment_file, "rb") as source, open(
+            f"{self.file}.{segment}", "wb"
+        ) as destination:
+            for key, region in index.items():
+                source.seek(region.offset)
+                destination.write(source.read(region.length))
+                compacted[key] = Region(offset, region.length)
+                offset += region.length
+
+        # the new index only takes effect once it atomically replaces the old
+        # one, so crashing before then leaves everything as it was.
+        self._write_index(segment, compacted)
+        return segment, compacted
+
+    async def _write(self, records: list[tuple[str, Optional[bytes]]]) -> None:
+        async with self.lock:
+            regions = iter(await asyncio.to_thread(self._append, records))
+
+        for key, encoded in records:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._garbage += previous.length
+
+            if encoded is not None:
+                self._index[key] = next(regions)
+
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if (
+            self._segment_size >= MIN_COMPACTION_SIZE
+            and self._garbage * 2 > self._segment_size
+            and (self._compaction_task is None or self._compaction_task.done())
+        ):
+            self._compaction_task = asyncio.create_task(self.compact())
+
+    async def compact(self) -> None:
+        """Copy the live values into a new segment, discarding garbage."""
+        async with self.lock:
+            old_segment_file = self.segment_file
+            segment, index = await asyncio.to_thread(self._compact, dict(self._index))
+
+            self._segment = segment
+            self._index = index
+            self._segment_size = sum(region.length for region in index.values())
+            self._garbage = 0
+            self._remap()
+
+        os.remove(old_segment_file)
+
+    async def _mutate(self, mutations: dict[str, tuple[Any, Optional[bytes]]]) -> None:
+        if self._batching():
+            # written all at once when the batch ends
+            for key, mutation in mutations.items():
+                if key not in self._batch_unwritten:
+                    self._batch_unwritten[key] = self._unwritten.get(key, _MISSING)
+                self._unwritten[key] = mutation[0]
+                self._batch[key] = mutation
+            return
+
+        if self._batch is not None:
+            # another task took the keys over, so the batch can't roll them back
+            for key in mutations:
+                self._batch.pop(key, None)
+                self._batch_unwritten.pop(key, None)
+
+        for key, (value, _) in mutations.items():
+            self._unwritten[key] = value
+
+        try:
+            await self._write(
+                [(key, encoded) for key, (_, encoded) in mutations.items()]
+            )
+        finally:
+            for key, (value, _) in mutations.items():
+                if self._unwritten.get(key) is value:
+                    del self._unwritten[key]
+
+    def _encode(self, key: str, value: Any) -> tuple[Any, bytes]:
+        encoded = json.dumps(value, cls=self.encoder).encode()
+        self._cache_value(key, value, len(encoded))
+        return value, encoded
+
+    async def put(self, key: str, value: VT) -> None:
+        if self._watchers:
+            self._notify("put", key, self.get(key), value)
+        await self._mutate({key: self._encode(key, value)})
+
+    async def delete(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+
+        if self._watchers:
+            self._notify("delete", key, self[key], None)
+        self._uncache(key)
+        await self._mutate({key: (_DELETED, None)})
+
+    async def put_many(
+        self, items: Mapping[str, VT] | Iterable[tuple[str, VT]]
+    ) -> None:
+        """Insert many values into storage and persist them in a single write."""
+        items = dict(items)
+
+        if self._watchers:
+            for key, value in items.items():
+                self._notify("put", key, self.get(key), value)
+
+        await self._mutate(
+            {key: self._encode(key, value) for key, value in items.items()}
+        )
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove many values from storage and persist the removals in a single
+        write.
+
+        If any of the keys are missing, nothing is removed.
+        """
+        keys = list(dict.fromkeys(keys))
+
+        for key in keys:
+            if key not in self:
+                raise KeyError(key)
+
+        for key in keys:
+            if self._watchers:
+                self._notify("delete", key, self[key], None)
+            self._uncache(key)
+
+        await self._mutate({key: (_DELETED, None) for key in keys})
+
+    @contextlib.asynccontextmanager
+    async def batch(self) -> AsyncIterator[Self]:
+        """Group mutations so that they are persisted in a single write.
+
+        Mutations made inside the ``async with`` block are visible right
+        away, but are only written once the block exits. If the block raises
+        an exception, they are all rolled back instead.
+
+        Only the mutations of the task that opened the batch (and the tasks it
+        starts) are part of it. Other tasks' mutations are written as usual
+        and are never rolled back, and their batches wait for this one to
+        end. Nested batches are part of the outermost one.
+        """
+        if self._batching():
+            yield self
+            return
+
+        async with self._open_batch():
+            self._batch = {}
+
+            try:
+                yield self
+            except BaseException:
+                batch, self._batch = self._batch, None
+                unwritten, self._batch_unwritten = self._batch_unwritten, {}
+
+                for key, (value, _) in batch.items():
+                    self._uncache(key)
+                    if unwritten[key] is _MISSING:
+                        self._unwritten.pop(key, None)
+                    else:
+                        self._unwritten[key] = unwritten[key]
+
+                    if self._watchers:
+                        current = None if value is _DELETED else value
+                        if key in self:
+                            self._notify("put", key, current, self[key])
+                        elif value is not _DELETED:
+                            self._notify("delete", key, current, None)
+                raise
+
+            batch, self._batch = self._batch, None
+            self._batch_unwritten = {}
+
+        if batch:
+            await self._mutate(batch)
+
+    async def aclose(self) -> None:
+        """Wait for background compaction to finish and unmap the segment."""
+        if self._compaction_task is not None:
+            await self._compaction_task
+
+        async with self.lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def get(self, key: str, default: Optional[VT] = None) -> VT:
+        try:
+            return self[key]
+        except KeyError:
+            return default  # type: ignore
+
+    def _keys(self) -> set[str]:
+        keys = self._index.keys() | self._unwritten.keys()
+        keys.difference_update(
+            key for key, value in self._unwritten.items() if value is _DELETED
+        )
+        return keys
+
+    def __iter__(self) -> Iterator[str]:
+        if not self._unwritten:
+            return iter(self._index)
+        return iter(self._keys())
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self._unwritten:
+            return self._unwritten[key] is not _DELETED
+        return key in self._index
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._unwritten:
+            value = self._unwritten[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return cached[0]
+
+        region = self._index[key]
+        self._misses += 1
+        value = self._read(region)
+        self._cache_value(key, value, region.length)
+        return value
+
+    def __len__(self) -> int:
+        if not self._unwritten:
+            return len(self._index)
+        return len(self._keys())
+
+    def __repr__(self) -> str:
+        return f"<IndexedStorage file={self.file!r}>"
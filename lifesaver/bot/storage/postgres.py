@@ -0,0 +1,354 @@
+# encoding: utf-8
+
+__all__ = ("PostgresStorage",)
+
+import asyncio
+import contextlib
+import json
+from typing import (
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Any,
+    Type,
+    Callable,
+    TYPE_CHECKING,
+)
+
+from typing_extensions import Self
+
+from .base import VT, AsyncStorage
+
+if TYPE_CHECKING:
+    import asyncpg
+
+_MISSING: Any = object()
+
+
+class PostgresStorage(AsyncStorage[VT]):
+    """Asynchronous data persistence to a PostgreSQL table.
+
+    Values are stored as ``JSONB`` rows keyed by ``name`` and the key, so many
+    storages (and many processes) can share the same table. Pass the bot's
+    pool, which is available as :attr:`lifesaver.bot.BotBase.pool` when
+    :attr:`lifesaver.bot.BotConfig.postgres` is configured:
+
+    .. code:: python3
+
+        self.tags = PostgresStorage(self.pool, "tags")
+        await self.tags.load()
+
+    Reads are served from an in-memory cache, so the mapping methods only see
+    keys that have been loaded with :meth:`load` or :meth:`fetch`, or were
+    written through this instance. Writes that are issued while a previous
+    write is in flight are coalesced into a single batched upsert. Setting
+    ``flush_interval`` delays every write by that many seconds to coalesce
+    even more of them.
+    """
+
+    def __init__(
+        self,
+        pool: "asyncpg.pool.Pool",
+        name: str,
+        *,
+        table: str = "lifesaver_storage",
+        encoder: Type[json.JSONEncoder] = json.JSONEncoder,
+        object_hook: Optional[Callable[[dict[Any, Any]], Any]] = None,
+        flush_interval: float = 0,
+    ) -> None:
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+
+        super().__init__()
+        self.pool = pool
+        self.name = name
+        self.table = table
+        self.encoder = encoder
+        self.object_hook = object_hook
+
+        #: The number of seconds to wait before writing, to coalesce writes.
+        self.flush_interval = flush_interval
+
+        self._cache: dict[str, Any] = {}
+        self._table_created = False
+
+        # keys to their encoded values, or None if they were deleted
+        self._pending: dict[str, Optional[str]] = {}
+        self._flushing: dict[str, Optional[str]] = {}
+        self._waiter: Optional[asyncio.Future[None]] = None
+        self._flush_task: Optional[asyncio.Task[None]] = None
+
+        # the cached values of keys before they were touched in the current batch
+        self._batch: Optional[dict[str, Any]] = None
+
+    async def _create_table(self) -> None:
+        if self._table_created:
+            return
+
+        await self.pool.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value JSONB NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """)
+        self._table_created = True
+
+    def _decode(self, value: str) -> Any:
+        return json.loads(value, object_hook=self.object_hook)
+
+    async def load(self) -> None:
+        """Load every value of this storage from the table into the cache."""
+        await self._create_table()
+        rows = await self.pool.fetch(
+            f"SELECT key, value::text FROM {self.table} WHERE namespace = $1",
+            self.name,
+        )
+        self._cache = {key: self._decode(value) for key, value in rows}
+
+    async def fetch(self, key: str, default: Optional[VT] = None) -> VT:
+        """Look up a value, reading it from the table if it isn't cached."""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        if self._unwritten(key):
+            # deleted, but the deletion hasn't been written yet
+            return default  # type: ignore
+
+        await self._create_table()
+        value = await self.pool.fetchval(
+            f"SELECT value::text FROM {self.table} WHERE namespace = $1 AND key = $2",
+            self.name,
+            key,
+        )
+        if key in self._cache:
+            # put while we were reading, so the row is already outdated
+            return self._cache[key]
+        if self._unwritten(key) or value is None:
+            # deleted while we were reading, or it doesn't exist
+            return default  # type: ignore
+
+        decoded = self._cache[key] = self._decode(value)
+        return decoded
+
+    def _unwritten(self, key: str) -> bool:
+        """Return whether a key was mutated without the mutation having been
+        written yet.
+        """
+        return (
+            key in self._pending
+            or key in self._flushing
+            or (self._batch is not None and key in self._batch)
+        )
+
+    async def _flush(self, pending: dict[str, Optional[str]]) -> None:
+        await self._create_table()
+
+        upserts = {key: value for key, value in pending.items() if value is not None}
+        deletes = [key for key, value in pending.items() if value is None]
+
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                if upserts:
+                    await connection.execute(
+                        f"""
+                        INSERT INTO {self.table} (namespace, key, value)
+                        SELECT $1, key, value::jsonb
+                        FROM unnest($2::text[], $3::text[]) AS pending(key, value)
+                        ON CONFLICT (namespace, key)
+                        DO UPDATE SET value = EXCLUDED.value
+                        """,
+                        self.name,
+                        list(upserts.keys()),
+                        list(upserts.values()),
+                    )
+                if deletes:
+                    await connection.execute(
+                        f"DELETE FROM {self.table} "
+                        "WHERE namespace = $1 AND key = ANY($2::text[])",
+                        self.name,
+                        deletes,
+                    )
+
+    async def _flush_pending(self) -> None:
+        if self.flush_interval:
+            await asyncio.sleep(self.flush_interval)
+
+        while self._pending:
+            self._flushing, self._pending = self._pending, {}
+            waiter, self._waiter = self._waiter, None
+
+            try:
+                await self._flush(self._flushing)
+            except Exception as exc:
+                # keep the writes around so the next one can try again. the
+                # ones that were made in the meantime are newer.
+                self._pending = {**self._flushing, **self._pending}
+
+                # the writes made in the meantime won't be written until then
+                # either
+                for failed in (waiter, self._waiter):
+                    if failed is not None:
+                        failed.set_exception(exc)
+                self._waiter = None
+                return
+            else:
+                if waiter is not None:
+                    waiter.set_result(None)
+            finally:
+                self._flushing = {}
+
+    async def _commit(self, pending: dict[str, Optional[str]]) -> None:
+        if self._batching():
+            # written all at once when the batch ends
+            return
+
+        self._pending.update(pending)
+
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        waiter = self._waiter
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+        await asyncio.shield(waiter)
+
+    def _remember(self, key: str) -> None:
+        if self._batch is None:
+            return
+
+        if self._batching():
+            if key not in self._batch:
+                self._batch[key] = self._cache.get(key, _MISSING)
+        else:
+            # another task took the key over, so the batch can't roll it back
+            self._batch.pop(key, None)
+
+    def _encode(self, value: Any) -> str:
+        return json.dumps(value, cls=self.encoder)
+
+    async def put(self, key: str, value: VT) -> None:
+        encoded = self._encode(value)
+        self._remember(key)
+        self._notify("put", key, self._cache.get(key), value)
+        self._cache[key] = value
+        await self._commit({key: encoded})
+
+    async def delete(self, key: str) -> None:
+        """Remove a value from storage and persist the removal.
+
+        Unlike the other storages, this doesn't raise :class:`KeyError` for keys
+        that aren't cached, because they might still exist in the table.
+        """
+        self._remember(key)
+        self._notify("delete", key, self._cache.pop(key, None), None)
+        await self._commit({key: None})
+
+    async def put_many(
+        self, items: Mapping[str, VT] | Iterable[tuple[str, VT]]
+    ) -> None:
+        """Insert many values into storage and persist them in a single upsert."""
+        pending: dict[str, Optional[str]] = {}
+
+        for key, value in dict(items).items():
+            pending[key] = self._encode(value)
+            self._remember(key)
+            self._notify("put", key, self._cache.get(key), value)
+            self._cache[key] = value
+
+        await self._commit(pending)
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove many values from storage and persist the removals in a single
+        statement.
+        """
+        pending: dict[str, Optional[str]] = {}
+
+        for key in keys:
+            pending[key] = None
+            self._remember(key)
+            self._notify("delete", key, self._cache.pop(key, None), None)
+
+        await self._commit(pending)
+
+    @contextlib.asynccontextmanager
+    async def batch(self) -> AsyncIterator[Self]:
+        """Group mutations so that they are persisted in a single transaction.
+
+        Mutations made inside the ``async with`` block are applied to the cache
+        right away, but are only written once the block exits. If the block
+        raises an exception, they are all rolled back instead.
+
+        Only the mutations of the task that opened the batch (and the tasks it
+        starts) are part of it. Other tasks' mutations are written as usual
+        and are never rolled back, and their batches wait for this one to
+        end. Nested batches are part of the outermost one.
+        """
+        if self._batching():
+            yield self
+            return
+
+        async with self._open_batch():
+            self._batch = {}
+
+            try:
+                yield self
+            except BaseException:
+                batch, self._batch = self._batch, None
+
+                for key, previous in batch.items():
+                    if previous is _MISSING:
+                        if key in self._cache:
+                            self._notify("delete", key, self._cache.pop(key), None)
+                    else:
+                        self._notify("put", key, self._cache.get(key), previous)
+                        self._cache[key] = previous
+                raise
+
+            batch, self._batch = self._batch, None
+
+        pending = {
+            key: self._encode(self._cache[key]) if key in self._cache else None
+            for key in batch
+        }
+        if pending:
+            await self._commit(pending)
+
+    async def aclose(self) -> None:
+        """Wait for pending writes to finish.
+
+        Writes that failed earlier are tried once more, raising if they fail
+        again.
+        """
+        if self._flush_task is not None:
+            await self._flush_task
+
+        if self._pending:
+            await self._commit({})
+
+    def get(self, key: str, default: Optional[VT] = None) -> VT:
+        return self._cache.get(key, default)
+
+    def all(self) -> dict[str, Any]:
+        return self._cache
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._cache)
+
+    def __contains__(self, key: Any) -> bool:
+        return str(key) in self._cache
+
+    def __getitem__(self, key: str) -> Any:
+        return self._cache[key]
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __repr__(self) -> str:
+        return f"<PostgresStorage name={self.name!r} table={self.table!r}>"
@@ -0,0 +1,477 @@
+# encoding: utf-8
+
+__all__ = ("SqliteStorage",)
+
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import queue
+import sqlite3
+import threading
+from typing import (
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Any,
+    Type,
+    Callable,
+    Literal,
+)
+
+from typing_extensions import Self
+
+from .base import VT, AsyncStorage
+
+Job = Callable[[sqlite3.Connection], Any]
+Statement = tuple[str, tuple[Any, ...]]
+
+_MISSING: Any = object()
+
+#: How many seconds to wait for the initial values to be read.
+STARTUP_TIMEOUT = 30
+
+
+class SqliteStorage(AsyncStorage[VT]):
+    """Asynchronous data persistence to a SQLite database.
+
+    Every key is stored as its own row, so writing a value only ever touches
+    that value. The database is owned by a dedicated worker thread, and all
+    statements that queue up while it is busy are run together in a single
+    transaction. The database uses write-ahead logging, so a crash never
+    leaves it half-written.
+
+    Values are encoded as JSON, using ``encoder`` and ``object_hook`` like
+    :class:`Storage`.
+
+    When ``cache`` is ``True`` (the default), every value is kept in memory
+    and reads never touch the database. Otherwise, reads are answered by the
+    worker thread, which briefly blocks the caller.
+    """
+
+    def __init__(
+        self,
+        file: str,
+        *,
+        table: str = "storage",
+        encoder: Type[json.JSONEncoder] = json.JSONEncoder,
+        object_hook: Optional[Callable[[dict[Any, Any]], Any]] = None,
+        cache: bool = True,
+    ) -> None:
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+
+        super().__init__()
+        self.file = file
+        self.table = table
+        self.encoder = encoder
+        self.object_hook = object_hook
+
+        self._cache: Optional[dict[str, Any]] = {} if cache else None
+
+        # the cached values of keys before they were touched in the current batch
+        self._batch: Optional[dict[str, Any]] = None
+        self._batch_statements: list[Statement] = []
+
+        # without a cache, changes made in a batch aren't visible until it
+        # ends, so they are only announced then
+        self._batch_changes: list[tuple[Any, ...]] = []
+
+        self._jobs: queue.SimpleQueue[
+            Optional[tuple[Job, concurrent.futures.Future[Any]]]
+        ] = queue.SimpleQueue()
+
+        # set once the worker thread has stopped, guarded by _stopping so that
+        # no job is queued after the remaining ones have been failed
+        self._stopped = False
+        self._stopping = threading.Lock()
+
+        # connect here so that errors are raised to the caller instead of
+        # killing the worker thread
+        connection = self._connect()
+        self._thread = threading.Thread(
+            target=self._work,
+            args=(connection,),
+            name=f"SqliteStorage[{file}]",
+            daemon=True,
+        )
+        self._thread.start()
+
+        if self._cache is not None:
+            self._cache = self._submit(self._fetch_all).result(STARTUP_TIMEOUT)
+
+    def _connect(self) -> sqlite3.Connection:
+        # the connection is handed off to the worker thread, which is the only
+        # thread to use it from then on
+        connection = sqlite3.connect(
+            self.file, isolation_level=None, check_same_thread=False
+        )
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+            )
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _stop(self) -> None:
+        """Fail every job that is still queued, and refuse any new ones."""
+        with self._stopping:
+            self._stopped = True
+
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                _, future = job
+                future.set_exception(RuntimeError("The storage is closed"))
+
+    def _work(self, connection: sqlite3.Connection) -> None:
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+
+                # everything that queued up while we were busy goes into the
+                # same transaction.
+                jobs = [job]
+                while True:
+                    try:
+                        job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        self._jobs.put(None)
+                        break
+                    jobs.append(job)
+
+                self._run(connection, jobs)
+        finally:
+            self._stop()
+            connection.close()
+
+    def _run(
+        self,
+        connection: sqlite3.Connection,
+        jobs: list[tuple[Job, concurrent.futures.Future[Any]]],
+    ) -> None:
+        results: list[tuple[concurrent.futures.Future[Any], Any, bool]] = []
+
+        try:
+            connection.execute("BEGIN")
+            for function, future in jobs:
+                try:
+                    results.append((future, function(connection), True))
+                except Exception as exc:
+                    results.append((future, exc, False))
+            connection.execute("COMMIT")
+        except Exception as exc:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            for _, future in jobs:
+                future.set_exception(exc)
+            return
+
+        for future, result, succeeded in results:
+            if succeeded:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _submit(self, function: Job) -> concurrent.futures.Future[Any]:
+        future: concurrent.futures.Future[Any] = concurrent.futures.Future()
+        with self._stopping:
+            if self._stopped:
+                future.set_exception(RuntimeError("The storage is closed"))
+            else:
+                self._jobs.put((function, future))
+        return future
+
+    async def _execute(self, function: Job) -> Any:
+        return await asyncio.wrap_future(self._submit(function))
+
+    def _query(self, function: Job) -> Any:
+        return self._submit(function).result()
+
+    def _decode(self, value: str) -> Any:
+        return json.loads(value, object_hook=self.object_hook)
+
+    def _fetch_all(self, connection: sqlite3.Connection) -> dict[str, Any]:
+        rows = connection.execute(f"SELECT key, value FROM {self.table}")
+        return {key: self._decode(value) for key, value in rows}
+
+    def _remember(self, key: str) -> None:
+        if self._cache is not None and self._batching() and key not in self._batch:
+            self._batch[key] = self._cache.get(key, _MISSING)
+
+    def _take_over(self, keys: set[str]) -> None:
+        """Drop keys that another task mutated from the open batch, so that it
+        neither rolls them back nor overwrites them when it ends.
+        """
+        assert self._batch is not None
+        for key in keys:
+            self._batch.pop(key, None)
+        # the key is the first parameter of every statement
+        self._batch_statements = [
+            statement
+            for statement in self._batch_statements
+            if statement[1][0] not in keys
+        ]
+        self._batch_changes = [
+            change for change in self._batch_changes if change[1] not in keys
+        ]
+
+    def _changed(self, kind: Literal["put", "delete"], key: str, new: Any) -> None:
+        if not self._watchers:
+            return
+
+        if self._cache is None:
+            if self._batching():
+                self._batch_changes.append((kind, key, new))
+            else:
+                self._notify(kind, key, None, new)
+        else:
+            self._notify(kind, key, self._cache.get(key), new)
+
+    async def _write(self, statements: list[Statement]) -> None:
+        if self._batching():
+            # run all at once when the batch ends
+            self._batch_statements.extend(statements)
+            return
+
+        if self._batch is not None:
+            self._take_over({parameters[0] for _, parameters in statements})
+
+        def run(connection: sqlite3.Connection) -> None:
+            # other jobs share the transaction, so use a savepoint to make
+            # sure that these statements are applied all together or not at all
+            connection.execute("SAVEPOINT write")
+            try:
+                for statement, parameters in statements:
+                    connection.execute(statement, parameters)
+            except BaseException:
+                connection.execute("ROLLBACK TO write")
+                raise
+            finally:
+                connection.execute("RELEASE write")
+
+        await self._execute(run)
+
+    def _put_statement(self, key: str, value: Any) -> Statement:
+        return (
+            f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+            (key, json.dumps(value, cls=self.encoder)),
+        )
+
+    def _delete_statement(self, key: str) -> Statement:
+        return (f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    async def put(self, key: str, value: VT) -> None:
+        statement = self._put_statement(key, value)
+        self._changed("put", key, value)
+
+        if self._cache is not None:
+            self._remember(key)
+            self._cache[key] = value
+
+        await self._write([statement])
+
+    async def _missing(self, keys: list[str]) -> list[str]:
+        """Return which of the keys don't exist, without blocking the event
+        loop like the mapping methods do.
+        """
+        if self._cache is not None:
+            return [key for key in keys if key not in self._cache]
+
+        def find(connection: sqlite3.Connection) -> set[str]:
+            existing: set[str] = set()
+            # stay below the limit of parameters per statement
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                rows = connection.execute(
+                    f"SELECT key FROM {self.table} "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                existing.update(key for key, in rows)
+            return existing
+
+        existing = await self._execute(find)
+        return [key for key in keys if key not in existing]
+
+    async def delete(self, key: str) -> None:
+        if await self._missing([key]):
+            raise KeyError(key)
+
+        self._changed("delete", key, None)
+
+        if self._cache is not None:
+            self._remember(key)
+            del self._cache[key]
+
+        await self._write([self._delete_statement(key)])
+
+    async def put_many(
+        self, items: Mapping[str, VT] | Iterable[tuple[str, VT]]
+    ) -> None:
+        """Insert many values into storage and persist them in one transaction."""
+        items = dict(items)
+        statements = [self._put_statement(key, value) for key, value in items.items()]
+
+        for key, value in items.items():
+            self._changed("put", key, value)
+
+        if self._cache is not None:
+            for key, value in items.items():
+                self._remember(key)
+                self._cache[key] = value
+
+        await self._write(statements)
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove many values from storage and persist the removals in one
+        transaction.
+
+        If any of the keys are missing, nothing is removed.
+        """
+        keys = list(dict.fromkeys(keys))
+
+        missing = await self._missing(keys)
+        if missing:
+            raise KeyError(missing[0])
+
+        for key in keys:
+            self._changed("delete", key, None)
+
+        if self._cache is not None:
+            for key in keys:
+                self._remember(key)
+                del self._cache[key]
+
+        await self._write([self._delete_statement(key) for key in keys])
+
+    @contextlib.asynccontextmanager
+    async def batch(self) -> AsyncIterator[Self]:
+        """Group mutations so that they are persisted in a single transaction.
+
+        Statements issued inside the ``async with`` block are only run once
+        the block exits, and are discarded if the block raises an exception.
+
+        Only the mutations of the task that opened the batch (and the tasks it
+        starts) are part of it. Other tasks' mutations are written as usual
+        and are never rolled back, and their batches wait for this one to
+        end. Nested batches are part of the outermost one.
+
+        Without a cache, reads inside the block don't see mutations made
+        inside of it.
+        """
+        if self._batching():
+            yield self
+            return
+
+        async with self._open_batch():
+            self._batch = {}
+            self._batch_statements = []
+            self._batch_changes = []
+
+            try:
+                yield self
+            except BaseException:
+                batch, self._batch = self._batch, None
+                self._batch_statements = []
+                self._batch_changes = []
+
+                if self._cache is not None:
+                    for key, previous in batch.items():
+                        if previous is _MISSING:
+                            if key in self._cache:
+                                self._changed("delete", key, None)
+                                del self._cache[key]
+                        else:
+                            self._changed("put", key, previous)
+                            self._cache[key] = previous
+                raise
+
+            self._batch = None
+            statements, self._batch_statements = self._batch_statements, []
+            changes, self._batch_changes = self._batch_changes, []
+
+        for kind, key, new in changes:
+            self._notify(kind, key, None, new)
+
+        if statements:
+            await self._write(statements)
+
+    async def aclose(self) -> None:
+        """Wait for pending statements to finish and close the database."""
+        self._jobs.put(None)
+        await asyncio.to_thread(self._thread.join)
+
+    def get(self, key: str, default: Optional[VT] = None) -> VT:
+        try:
+            return self[key]
+        except KeyError:
+            return default  # type: ignore
+
+    def all(self) -> dict[str, Any]:
+        if self._cache is not None:
+            return self._cache
+        return self._query(self._fetch_all)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._cache is not None:
+            return iter(self._cache)
+
+        rows = self._query(
+            lambda connection: connection.execute(
+                f"SELECT key FROM {self.table}"
+            ).fetchall()
+        )
+        return iter([key for (key,) in rows])
+
+    def __contains__(self, key: Any) -> bool:
+        if self._cache is not None:
+            return str(key) in self._cache
+
+        row = self._query(
+            lambda connection: connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ?", (str(key),)
+            ).fetchone()
+        )
+        return row is not None
+
+    def __getitem__(self, key: str) -> Any:
+        if self._cache is not None:
+            return self._cache[key]
+
+        row = self._query(
+            lambda connection: connection.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        )
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row[0])
+
+    def __len__(self) -> int:
+        if self._cache is not None:
+            return len(self._cache)
+
+        (count,) = self._query(
+            lambda connection: connection.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()
+        )
+        return count
+
+    def __repr__(self) -> str:
+        return f"<SqliteStorage file={self.file!r} table={self.table!r}>"
@@ -1,15 +1,37 @@
 # encoding: utf-8
 
-__all__ = ["HotEvent", "PollerPlug", "Poller"]
+__all__ = ["HotEvent", "PollerPlug", "Poller", "merge_events"]
 
 import asyncio
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import hashlib
 import logging
+import os
 import re
-from collections import defaultdict
+import stat
+import struct
+import sys
+import time
 from pathlib import Path
-from typing import Dict, Set, Union, List, Optional, DefaultDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Set,
+    Union,
+    List,
+    Literal,
+    Optional,
+    NamedTuple,
+    Tuple,
+)
 
 from lifesaver.load_list import filter_path, transform_path
+from lifesaver.utils.timing import Timer
 
 HotEvent = Dict[str, Set[Path]]
 
@@ -17,13 +39,178 @@ HASHED_FILENAME = re.compile(r"[a-f0-9]{8,}")
 
 log = logging.getLogger(__name__)
 
+# from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC if hasattr(os, "O_CLOEXEC") else 0
+
+INOTIFY_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+#: The layout of the fixed-size part of ``struct inotify_event``.
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+#: How long a directory's mtime has to be in the past before its listing is
+#: trusted, to cover filesystems with coarse timestamps.
+MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+class _Listing(NamedTuple):
+    mtime_ns: int
+    #: Whether the directory hadn't changed for a while when it was listed.
+    stable: bool
+    files: List[Path]
+    directories: List[Path]
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    if not sys.platform.startswith("linux"):
+        return None
 
-class Poller:
-    """A crude, timer-based filesystem poller for detecting file creation,
-    modification, and deletion.
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+_libc = _load_libc()
+
+
+class _Inotify:
+    """A thin wrapper around an inotify instance."""
+
+    def __init__(self) -> None:
+        assert _libc is not None
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise self._error()
+
+    @staticmethod
+    def _error() -> OSError:
+        code = ctypes.get_errno()
+        return OSError(code, os.strerror(code))
+
+    def add_watch(self, path: Path) -> int:
+        assert _libc is not None
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            raise self._error()
+        return wd
 
-    It works by repeatedly querying the search paths every ``polling_interval``
-    seconds (by default, ``1``).
+    def remove_watch(self, wd: int) -> None:
+        assert _libc is not None
+        # fails if the watch is already gone, which is fine
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """Read all pending events as tuples of their watch descriptor, mask,
+        and name.
+        """
+        events = []
+
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += _INOTIFY_EVENT.size
+                name = buffer[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def merge_events(first: HotEvent, second: HotEvent) -> HotEvent:
+    """Merge two consecutive events into one that describes both.
+
+    For example, a file that was created and then updated counts as created,
+    and a file that was created and then deleted is left out entirely.
+    """
+    kinds: Dict[Path, str] = {}
+
+    for event in (first, second):
+        for kind in ("deleted", "created", "updated"):
+            for path in event.get(kind, ()):
+                previous = kinds.get(path)
+                if previous == "created":
+                    # anything but deleting it leaves it new
+                    if kind == "deleted":
+                        del kinds[path]
+                elif previous == "deleted" and kind == "created":
+                    kinds[path] = "updated"
+                else:
+                    kinds[path] = kind
+
+    merged: HotEvent = {"created": set(), "deleted": set(), "updated": set()}
+    for path, kind in kinds.items():
+        merged[kind].add(path)
+    return merged
+
+
+class Poller:
+    """A filesystem watcher for detecting file creation, modification, and
+    deletion.
+
+    On Linux, it is notified of changes by the kernel through inotify. It
+    falls back to repeatedly querying the search paths every
+    ``polling_interval`` seconds (by default, ``1``), including when inotify
+    fails (such as when running out of watches). Pass ``backend`` to choose
+    between ``"inotify"`` and ``"polling"`` explicitly.
+
+    When polling, only directories whose mtime changed are listed again, and
+    the interval doubles every time nothing changed, up to
+    ``max_polling_interval`` seconds (by default, ``8``). It drops back to
+    ``polling_interval`` as soon as something changes.
+
+    Scans run in a worker thread so that they don't block the event loop,
+    and how long the latest one took is kept in :attr:`last_scan_duration`.
+
+    If ``debounce`` is set, changes are held back until nothing has changed
+    for that many seconds, and everything that changed in the meantime is
+    merged into a single event.
+
+    Files are considered updated whenever their mtime goes up. If
+    ``content_hash`` is set, files whose size or mtime changed are hashed
+    instead, and only reported as updated if their contents changed. This
+    avoids reloading extensions that were only touched or checked out again.
+    The files that already exist are hashed by the first scan in the worker
+    thread rather than by the constructor.
 
     **Caveat:** All files are filtered through :func:`lifesaver.load_list.filter_path`,
     and files with hashes (at least 8 consecutive hexadecimal characters) are ignored.
@@ -51,6 +238,10 @@ class Poller:
         *,
         polling_interval: float = 1,
         name: Optional[str] = None,
+        backend: Literal["auto", "inotify", "polling"] = "auto",
+        max_polling_interval: float = 8,
+        debounce: float = 0,
+        content_hash: bool = False,
     ) -> None:
         if isinstance(paths, list):
             self.paths = paths
@@ -59,16 +250,70 @@ class Poller:
             self.paths = [paths]
             self.name = name or str(paths)
 
+        # whether to fall back to polling if inotify fails
+        self._fallback = backend == "auto"
+
+        if backend == "auto":
+            backend = "polling" if _libc is None else "inotify"
+        elif backend == "inotify" and _libc is None:
+            raise RuntimeError("inotify isn't available on this platform")
+        elif backend not in ("inotify", "polling"):
+            raise ValueError(f"Unknown backend: {backend!r}")
+
+        #: How changes are detected, either ``"inotify"`` or ``"polling"``.
+        self.backend = backend
+
         self.polling_interval = polling_interval
-        self.state = self._build_state()
+
+        #: The longest that the polling interval backs off to while nothing
+        #: is changing.
+        self.max_polling_interval = max(max_polling_interval, polling_interval)
+
+        #: The number of seconds until the next scan when polling.
+        self.current_interval = polling_interval
+
+        #: How many seconds have to pass without changes before they're
+        #: yielded.
+        self.debounce = debounce
+
+        #: Whether files are hashed to tell whether their contents changed.
+        self.content_hash = content_hash
+
+        #: How long the latest scan took, in seconds.
+        self.last_scan_duration: Optional[float] = None
+
         self.log = logging.getLogger(f"{__name__}[{self.name}]")
 
+        #: All applicable files to their last modified time.
+        self.state: Dict[Path, float] = {}
+
+        # directories to what they contained when they were last listed
+        self._listings: Dict[Path, _Listing] = {}
+
+        # paths to whether filter_entry included them
+        self._filtered: Dict[Path, bool] = {}
+
+        # the sizes and hashes of files, if content_hash is enabled
+        self._sizes: Dict[Path, int] = {}
+        self._hashes: Dict[Path, Optional[bytes]] = {}
+
+        # whether the files found by the initial scan were hashed, which is
+        # left to the first threaded scan to keep the constructor cheap
+        self._hashes_primed = not content_hash
+
+        self.detect()
+
+        # inotify watch descriptors to the directories they watch, and back
+        self._watches: Dict[int, Path] = {}
+        self._watched_dirs: Dict[Path, int] = {}
+
         self.log.debug("watching: %r", self.paths)
         self.log.debug("initial state: %s", self.state)
 
     def __repr__(self) -> str:
         return (
-            f"<Poller paths={self.paths!r} polling_interval={self.polling_interval!r}>"
+            f"<Poller paths={self.paths!r} backend={self.backend!r} "
+            f"polling_interval={self.polling_interval!r}>"
         )
 
     def filter_entry(self, entry: Path) -> bool:
@@ -84,51 +329,404 @@ class Poller:
 
         return match is None
 
-    def _build_state(self) -> Dict[Path, float]:
-        """Return a dict of all applicable files to their last modified time."""
-        state = {}
+    def _filter(self, entry: Path) -> bool:
+        # filter_entry, but only computed once per path
+        try:
+            return self._filtered[entry]
+        except KeyError:
+            included = self._filtered[entry] = self.filter_entry(entry)
+            return included
 
-        for path in self.paths:
-            state.update(
-                {
-                    entry: entry.stat().st_mtime
-                    for entry in path.glob("**/*")
-                    if entry.is_file() and self.filter_entry(entry)
-                }
-            )
+    def _hash(self, path: Path) -> Optional[bytes]:
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(path, "rb") as fp:
+                for chunk in iter(lambda: fp.read(64 * 1024), b""):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return digest.digest()
+
+    def _record(self, path: Path, stats: os.stat_result) -> Optional[str]:
+        """Record the latest stats of a file, returning whether it was
+        ``"created"`` or ``"updated"``, or ``None`` if it didn't change.
+        """
+        previous_mtime = self.state.get(path)
+
+        if not self.content_hash:
+            if previous_mtime is not None and stats.st_mtime <= previous_mtime:
+                return None
+            self.state[path] = stats.st_mtime
+            return "created" if previous_mtime is None else "updated"
 
-        return state
+        previous_size = self._sizes.get(path)
+        if stats.st_mtime == previous_mtime and stats.st_size == previous_size:
+            return None
+
+        self.state[path] = stats.st_mtime
+        self._sizes[path] = stats.st_size
+
+        if previous_mtime is None:
+            if self._hashes_primed:
+                self._hashes[path] = self._hash(path)
+            return "created"
+        if not self._hashes_primed:
+            # there's nothing to compare against yet
+            return "updated"
+
+        previous_digest = self._hashes.get(path)
+        digest = self._hashes[path] = self._hash(path)
+        if (
+            stats.st_size == previous_size
+            and digest is not None
+            and digest == previous_digest
+        ):
+            self.log.debug("skipping %s, its contents didn't change", path)
+            return None
+        return "updated"
+
+    def _prime_hashes(self) -> None:
+        """Hash the files that were found before hashing began."""
+        for path in list(self.state):
+            if path in self._hashes:
+                continue
+            digest = self._hash(path)
+            try:
+                stats = path.stat()
+            except OSError:
+                continue
+            # if it changed while being hashed, the next scan reports it
+            if stats.st_mtime == self.state.get(
+                path
+            ) and stats.st_size == self._sizes.get(path):
+                self._hashes[path] = digest
+        self._hashes_primed = True
+
+    def _drop(self, path: Path) -> bool:
+        """Stop tracking a file, returning whether it was tracked."""
+        self._sizes.pop(path, None)
+        self._hashes.pop(path, None)
+        return self.state.pop(path, None) is not None
+
+    def _forget(self, directory: Path, changes: HotEvent) -> None:
+        """Drop a removed directory from the cache, deleting everything in it."""
+        listing = self._listings.pop(directory, None)
+        if listing is None:
+            return
+
+        for file in listing.files:
+            self._filtered.pop(file, None)
+            if self._drop(file):
+                changes["deleted"].add(file)
+        for subdirectory in listing.directories:
+            self._forget(subdirectory, changes)
+
+    def _list(self, directory: Path, mtime_ns: int) -> _Listing:
+        files = []
+        directories = []
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if filter_path(entry.name):
+                        directories.append(Path(entry.path))
+                elif entry.is_file():
+                    path = Path(entry.path)
+                    if self._filter(path):
+                        files.append(path)
+
+        # a directory that changed very recently might change again within
+        # the granularity of its mtime, so don't trust it until it settles
+        stable = time.time_ns() - mtime_ns > MTIME_GRANULARITY_NS
+        return _Listing(mtime_ns, stable, files, directories)
+
+    def _scan(self, directory: Path, changes: HotEvent) -> None:
+        """Scan a directory and everything below it for changes.
+
+        Directories are only listed again if their mtime changed. Their files
+        still have to be stat'd, because modifying a file doesn't touch the
+        mtime of its directory.
+        """
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            self._forget(directory, changes)
+            return
+
+        listing = self._listings.get(directory)
+        if listing is None or not listing.stable or listing.mtime_ns != mtime_ns:
+            try:
+                new_listing = self._list(directory, mtime_ns)
+            except (FileNotFoundError, NotADirectoryError):
+                self._forget(directory, changes)
+                return
+
+            if listing is not None:
+                for file in set(listing.files).difference(new_listing.files):
+                    self._filtered.pop(file, None)
+                    if self._drop(file):
+                        changes["deleted"].add(file)
+                for subdirectory in set(listing.directories).difference(
+                    new_listing.directories
+                ):
+                    self._forget(subdirectory, changes)
+
+            listing = self._listings[directory] = new_listing
+
+        for file in listing.files:
+            try:
+                stats = os.stat(file)
+            except (FileNotFoundError, NotADirectoryError):
+                # removed since the directory was listed
+                if self._drop(file):
+                    changes["deleted"].add(file)
+                continue
+
+            kind = self._record(file, stats)
+            if kind is not None:
+                changes[kind].add(file)
+
+        for subdirectory in listing.directories:
+            self._scan(subdirectory, changes)
 
     def detect(self) -> Optional[HotEvent]:
-        """Diff the old state with a new state, returning a dict describing
-        the new changes, or `None` if no changes were detected.
+        """Scan the search paths for changes since the last scan, returning a
+        dict describing the new changes, or `None` if no changes were detected.
         """
-        new_state = self._build_state()
-        new_state_filenames = set(new_state.keys())
-        old_state_filenames = set(self.state.keys())
-        changes: DefaultDict[str, set] = defaultdict(set)
+        changes: HotEvent = {"created": set(), "deleted": set(), "updated": set()}
 
-        if new_state == self.state:
+        for path in self.paths:
+            self._scan(path, changes)
+
+        if not any(changes.values()):
+            return None
+        return changes
+
+    def _watch_tree(self, inotify: _Inotify, root: Path) -> None:
+        """Watch a directory and all directories below it."""
+        for directory, dirnames, _ in os.walk(root):
+            path = Path(directory)
+            try:
+                wd = inotify.add_watch(path)
+            except OSError as error:
+                if error.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                # removed while walking, which we'll also be notified of
+                continue
+
+            self._watches[wd] = path
+            self._watched_dirs[path] = wd
+            dirnames[:] = [name for name in dirnames if filter_path(name)]
+
+    def _diff_paths(self, inotify: _Inotify, touched: Set[Path]) -> Optional[HotEvent]:
+        """Diff the paths that inotify reported against the old state."""
+        changes: HotEvent = {"created": set(), "deleted": set(), "updated": set()}
+
+        for path in touched:
+            try:
+                stats: Optional[os.stat_result] = path.stat()
+            except (FileNotFoundError, NotADirectoryError):
+                stats = None
+
+            if stats is None:
+                if self._drop(path):
+                    changes["deleted"].add(path)
+                elif path in self._watched_dirs:
+                    # a directory was removed, along with everything in it
+                    wd = self._watched_dirs.pop(path)
+                    if self._watches.pop(wd, None) is not None:
+                        # it might have been moved instead
+                        inotify.remove_watch(wd)
+                    for file in [file for file in self.state if path in file.parents]:
+                        changes["deleted"].add(file)
+                        self._drop(file)
+                continue
+
+            if stat.S_ISDIR(stats.st_mode):
+                if self._watched_dirs.get(path) in self._watches or not filter_path(
+                    path.name
+                ):
+                    continue
+                # a directory was created or moved here, with whatever is in it
+                self._watch_tree(inotify, path)
+                for file in path.glob("**/*"):
+                    if file.is_file() and self.filter_entry(file):
+                        kind = self._record(file, file.stat())
+                        if kind is not None:
+                            changes[kind].add(file)
+                continue
+
+            if not stat.S_ISREG(stats.st_mode) or not self.filter_entry(path):
+                continue
+
+            kind = self._record(path, stats)
+            if kind is not None:
+                changes[kind].add(path)
+
+        if not any(changes.values()):
             return None
+        return changes
 
-        changes["deleted"] = old_state_filenames - new_state_filenames
-        changes["created"] = new_state_filenames - old_state_filenames
-        changes["updated"] = set(
-            filename
-            for (filename, current_mtime) in new_state.items()
-            if filename in self.state and current_mtime > self.state[filename]
-        )
+    def _rewatch(self, inotify: _Inotify) -> Optional[HotEvent]:
+        """Watch every search path, then scan them for changes."""
+        for path in self.paths:
+            self._watch_tree(inotify, path)
+        return self.detect()
 
-        self.state = new_state
-        return dict(changes)
+    def _rescan(self, inotify: _Inotify) -> Optional[HotEvent]:
+        """Watch and scan every search path from scratch."""
+        for path in self.paths:
+            self._watch_tree(inotify, path)
+        return self._full_scan()
+
+    def _full_scan(self) -> Optional[HotEvent]:
+        """Scan every search path without relying on the cached listings."""
+        # the listings are stale, because inotify changes don't update them.
+        # without them, deletions have to be found by what the scan didn't see.
+        self._listings.clear()
+        changes = self.detect() or {
+            "created": set(),
+            "deleted": set(),
+            "updated": set(),
+        }
+
+        seen = {file for listing in self._listings.values() for file in listing.files}
+        for file in [file for file in self.state if file not in seen]:
+            self._drop(file)
+            changes["deleted"].add(file)
+
+        if not any(changes.values()):
+            return None
+        return changes
+
+    def _timed(
+        self, scan: Callable[..., Optional[HotEvent]], *args: Any
+    ) -> Optional[HotEvent]:
+        with Timer() as timer:
+            changes = scan(*args)
+            if not self._hashes_primed:
+                self._prime_hashes()
+        self.last_scan_duration = timer.duration
+        self.log.debug("scan took %s", timer)
+        return changes
+
+    async def _run_scan(
+        self, scan: Callable[..., Optional[HotEvent]], *args: Any
+    ) -> Optional[HotEvent]:
+        """Run a scan in a worker thread, timing it."""
+        return await asyncio.to_thread(self._timed, scan, *args)
+
+    async def _watch(self) -> AsyncIterator[HotEvent]:
+        loop = asyncio.get_running_loop()
+        inotify = _Inotify()
+        ready = asyncio.Event()
+        loop.add_reader(inotify.fd, ready.set)
+
+        try:
+            # catch anything that changed before we started watching
+            changes = await self._run_scan(self._rewatch, inotify)
+            if changes is not None:
+                yield changes
+
+            while True:
+                await ready.wait()
+                ready.clear()
+
+                touched: Set[Path] = set()
+                overflowed = False
+
+                for wd, mask, name in inotify.read():
+                    if mask & IN_Q_OVERFLOW:
+                        overflowed = True
+                        continue
+
+                    directory = self._watches.get(wd)
+                    if directory is None:
+                        continue
+
+                    if mask & IN_IGNORED:
+                        # the directory itself is gone
+                        self._watches.pop(wd, None)
+                        touched.add(directory)
+                        continue
+
+                    touched.add(directory / name if name else directory)
+
+                if overflowed:
+                    # events were lost, so fall back to a full scan
+                    self.log.warning("inotify queue overflowed, rescanning")
+                    changes = await self._run_scan(self._rescan, inotify)
+                else:
+                    changes = await self._run_scan(self._diff_paths, inotify, touched)
+
+                if changes is not None:
+                    self.log.debug("yielding changes: %s", changes)
+                    yield changes
+        finally:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+            self._watches.clear()
+            self._watched_dirs.clear()
+
+    async def _changes(self) -> AsyncIterator[HotEvent]:
+        if self.backend == "inotify":
+            try:
+                async for changes in self._watch():
+                    yield changes
+                return
+            except OSError as error:
+                # such as running out of inotify instances or watches
+                if not self._fallback:
+                    raise
+                self.log.warning("inotify failed, falling back to polling: %s", error)
+
+            self.backend = "polling"
+            changes = await self._run_scan(self._full_scan)
+            if changes is not None:
+                yield changes
 
-    async def __aiter__(self):
         while True:
-            changes = self.detect()
+            changes = await self._run_scan(self.detect)
             if changes is not None:
+                self.current_interval = self.polling_interval
                 self.log.debug("yielding changes: %s", changes)
                 yield changes
-            await asyncio.sleep(self.polling_interval)
+            else:
+                self.current_interval = min(
+                    self.current_interval * 2, self.max_polling_interval
+                )
+            await asyncio.sleep(self.current_interval)
+
+    async def __aiter__(self):
+        changes = self._changes()
+
+        if not self.debounce:
+            async for event in changes:
+                yield event
+            return
+
+        pending: Optional[HotEvent] = None
+        upcoming = asyncio.ensure_future(changes.__anext__())
+
+        try:
+            while True:
+                if pending is not None:
+                    await asyncio.wait({upcoming}, timeout=self.debounce)
+                    if not upcoming.done():
+                        # things have settled down
+                        self.log.debug("yielding debounced changes: %s", pending)
+                        event, pending = pending, None
+                        yield event
+                        continue
+
+                event = await upcoming
+                pending = event if pending is None else merge_events(pending, event)
+                upcoming = asyncio.ensure_future(changes.__anext__())
+        finally:
+            upcoming.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                await upcoming
+            await changes.aclose()
 
 
 class PollerPlug:
@@ -220,24 +818,44 @@ class PollerPlug:
         return extension_module
 
     async def handle(self, event: HotEvent) -> None:
+        """Act on an event, loading, unloading, or reloading each affected
+        extension once, no matter how many of its files changed.
+        """
+        # the extensions to act on, each only once
+        created = {
+            module: None
+            for module in (
+                self.resolve_module(path, resolve_subfiles=False)
+                for path in event["created"]
+            )
+            if module is not None
+        }
+        deleted = {
+            module: None
+            for module in (
+                self.resolve_module(path, resolve_subfiles=True)
+                for path in event["deleted"]
+            )
+            if module is not None
+        }
+        updated = {self.resolve_module(path): None for path in event["updated"]}
+
+        # loading or unloading these already takes care of their changes
+        for module in [*created, *deleted]:
+            updated.pop(module, None)
+
         # load new extensions
-        for created in event["created"]:
-            module = self.resolve_module(created, resolve_subfiles=False)
-            if module is not None:
-                log.info("loading new extension %s", module)
-                await self.try_load(module)
+        for module in created:
+            log.info("loading new extension %s", module)
+            await self.try_load(module)
 
         # unload deleted extensions
-        for deleted in event["deleted"]:
-            module = self.resolve_module(deleted, resolve_subfiles=True)
-
-            if module is not None and module in self.bot.extensions:
+        for module in deleted:
+            if module in self.bot.extensions:
                 log.info("unloading deleted extension %s", module)
                 await self.bot.unload_extension(module)
 
         # reload updated extensions
-        for updated in event["updated"]:
-            module = self.resolve_module(updated)
+        for module in updated:
             log.info("reloading extension %s", module)
-
             await self.bot.reload_extension(module)
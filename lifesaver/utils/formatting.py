@@ -11,6 +11,8 @@ __all__ = [
     "clean_mentions",
     "pluralize",
     "format_traceback",
+    "capture_traceback",
+    "render_traceback",
 ]
 
 """Text formatting and processing utilities."""
@@ -344,6 +346,40 @@ def pluralize(
     return with_s + indicative
 
 
+@functools.lru_cache(maxsize=None)
+def _packages_dir() -> str:
+    return str(pathlib.Path(discord.__file__).parent.parent.resolve())
+
+
+def capture_traceback(
+    exc: BaseException, *, limit: int = 7
+) -> traceback.TracebackException:
+    """Capture what is needed to format an exception later.
+
+    This only walks the traceback, so it is cheap enough to do on the event
+    loop. The source lines of the frames aren't read until the captured
+    traceback is formatted.
+    """
+    return traceback.TracebackException(
+        type(exc), exc, exc.__traceback__, limit=limit, lookup_lines=False
+    )
+
+
+def _format_captured_traceback(
+    captured: traceback.TracebackException, *, shorten_paths: bool
+) -> str:
+    formatted = "".join(captured.format())
+
+    if shorten_paths:
+        # Hide the current working directory to shorten text.
+        formatted = formatted.replace(os.getcwd(), "/...")
+
+        # Hide the path to the Python packages directory to shorten text.
+        formatted = formatted.replace(_packages_dir(), "/packages")
+
+    return formatted
+
+
 def format_traceback(
     exc: BaseException, *, limit: int = 7, shorten_paths: bool = False
 ) -> str:
@@ -358,17 +394,21 @@ def format_traceback(
         Attempts to shorten the current working directory and Python packages
         path.
     """
-
-    formatted = "".join(
-        traceback.format_exception(type(exc), exc, exc.__traceback__, limit=limit)
+    return _format_captured_traceback(
+        capture_traceback(exc, limit=limit), shorten_paths=shorten_paths
     )
 
-    if shorten_paths:
-        # Hide the current working directory to shorten text.
-        formatted = formatted.replace(os.getcwd(), "/...")
 
-        # Hide the path to the Python packages directory to shorten text.
-        packages_dir = str(pathlib.Path(discord.__file__).parent.parent.resolve())
-        formatted = formatted.replace(packages_dir, "/packages")
+async def render_traceback(
+    exc: BaseException, *, limit: int = 7, shorten_paths: bool = False
+) -> str:
+    """Format an exception into a traceback like :func:`format_traceback`,
+    without blocking the event loop.
 
-    return formatted
+    The traceback is captured right away, and formatted (which reads the
+    source files of the frames) in a worker thread.
+    """
+    captured = capture_traceback(exc, limit=limit)
+    return await asyncio.to_thread(
+        _format_captured_traceback, captured, shorten_paths=shorten_paths
+    )
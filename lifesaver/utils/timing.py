@@ -26,8 +26,9 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-__all__ = ["Timer", "format_seconds", "Ratelimiter"]
+__all__ = ["Timer", "format_seconds", "Ratelimiter", "CircuitBreaker"]
 
+import collections
 import time
 import typing as T
 
@@ -156,3 +157,77 @@ class Ratelimiter:
             and self.rate == other.rate
             and self.per == other.per
         )
+
+
+class CircuitBreaker:
+    """A mechanism that trips once ``threshold`` events happen within ``per``
+    seconds.
+
+    Once tripped, the breaker is open and :meth:`hit` returns ``True``. It
+    closes again once at least ``cooldown`` seconds have passed since it
+    tripped and the rate of events has dropped below the threshold.
+    """
+
+    def __init__(
+        self, threshold: int, per: T.Union[int, float], *, cooldown: float
+    ) -> None:
+        self.threshold = threshold
+        self.per = per
+        self.cooldown = cooldown
+
+        #: The :func:`time.monotonic` timestamp of when the breaker tripped,
+        #: or ``None`` if it is closed.
+        self.tripped_at: T.Optional[float] = None
+
+        #: The number of events while the breaker has been open.
+        self.suppressed = 0
+
+        #: The number of times that the breaker has tripped.
+        self.trips = 0
+
+        # the timestamps of the latest events
+        self._events: T.Deque[float] = collections.deque(maxlen=threshold)
+
+    def _exceeded(self, now: float) -> bool:
+        return len(self._events) >= self.threshold and now - self._events[0] <= self.per
+
+    def _update(self, now: float) -> None:
+        if (
+            self.tripped_at is not None
+            and now - self.tripped_at >= self.cooldown
+            and not self._exceeded(now)
+        ):
+            self.tripped_at = None
+
+    @property
+    def is_open(self) -> bool:
+        """Return whether the breaker is open (tripped)."""
+        self._update(time.monotonic())
+        return self.tripped_at is not None
+
+    @property
+    def state(self) -> str:
+        """Return ``"open"`` or ``"closed"``."""
+        return "open" if self.is_open else "closed"
+
+    def hit(self) -> bool:
+        """Record an event, and return whether the breaker is open."""
+        now = time.monotonic()
+        self._update(now)
+        self._events.append(now)
+
+        if self.tripped_at is None and self._exceeded(now):
+            self.tripped_at = now
+            self.suppressed = 0
+            self.trips += 1
+
+        if self.tripped_at is not None:
+            self.suppressed += 1
+            return True
+        return False
+
+    def __repr__(self) -> str:
+        return (
+            f"<CircuitBreaker threshold={self.threshold} per={self.per} "
+            f"state={self.state!r}>"
+        )
@@ -0,0 +1,252 @@
+# encoding: utf-8
+
+"""Tests for :class:`lifesaver.bot.storage.PostgresStorage` against a stand-in
+for an asyncpg pool, which keeps the table in a dict.
+
+Run with ``python -m pytest tests`` from the repository root.
+"""
+
+import asyncio
+import contextlib
+import json
+from typing import Any, Optional
+
+import pytest
+
+from lifesaver.bot.storage import PostgresStorage
+
+
+class FakeConnection:
+    def __init__(self, pool: "FakePool") -> None:
+        self.pool = pool
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        # statements only take effect if the whole transaction succeeds
+        rows = dict(self.pool.rows)
+        try:
+            yield
+        except BaseException:
+            self.pool.rows = rows
+            raise
+
+    async def execute(self, query: str, *args: Any) -> None:
+        await self.pool.execute(query, *args)
+
+
+class FakePool:
+    """Understands just enough SQL to stand in for PostgreSQL."""
+
+    def __init__(self) -> None:
+        #: (namespace, key) to the encoded value of every row.
+        self.rows: dict[tuple[str, str], str] = {}
+
+        #: The exception to raise from the next statement, if any.
+        self.error: Optional[Exception] = None
+
+        #: The number of transactions that were run.
+        self.transactions = 0
+
+    async def execute(self, query: str, *args: Any) -> None:
+        # let other writes queue up, like a real round trip would
+        await asyncio.sleep(0)
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+        query = " ".join(query.split())
+        if query.startswith("CREATE TABLE"):
+            return
+        if query.startswith("INSERT"):
+            namespace, keys, values = args
+            for key, value in zip(keys, values):
+                self.rows[namespace, key] = value
+        elif query.startswith("DELETE"):
+            namespace, keys = args
+            for key in keys:
+                self.rows.pop((namespace, key), None)
+        else:
+            raise NotImplementedError(query)
+
+    async def fetch(self, query: str, namespace: str) -> list[tuple[str, str]]:
+        return [
+            (key, value)
+            for (row_namespace, key), value in self.rows.items()
+            if row_namespace == namespace
+        ]
+
+    async def fetchval(self, query: str, namespace: str, key: str) -> Optional[str]:
+        return self.rows.get((namespace, key))
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        self.transactions += 1
+        yield FakeConnection(self)
+
+    def values(self, namespace: str) -> dict[str, Any]:
+        return {
+            key: json.loads(value)
+            for (row_namespace, key), value in self.rows.items()
+            if row_namespace == namespace
+        }
+
+
+def run(coroutine) -> Any:
+    return asyncio.run(coroutine)
+
+
+def test_put_and_delete() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await storage.put("a", {"content": "hi"})
+        await storage.put("b", 2)
+        await storage.delete("b")
+
+        assert pool.values("tags") == {"a": {"content": "hi"}}
+
+        reloaded = PostgresStorage(pool, "tags")
+        await reloaded.load()
+        assert reloaded.all() == {"a": {"content": "hi"}}
+        assert await reloaded.fetch("missing", 0) == 0
+
+    run(main())
+
+
+def test_concurrent_writes_are_coalesced() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await asyncio.gather(*(storage.put(str(n), n) for n in range(50)))
+
+        assert pool.values("tags") == {str(n): n for n in range(50)}
+        assert pool.transactions < 50
+
+    run(main())
+
+
+def test_failed_flush_is_retried() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await storage.put("a", 1)
+
+        pool.error = ConnectionError("lost connection")
+        with pytest.raises(ConnectionError):
+            await storage.put("a", 2)
+
+        # the cache keeps the new value, and so must the table eventually
+        assert storage["a"] == 2
+        assert pool.values("tags") == {"a": 1}
+
+        await storage.put("b", 3)
+        assert pool.values("tags") == {"a": 2, "b": 3}
+
+    run(main())
+
+
+def test_failed_flush_does_not_overwrite_newer_writes() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+
+        pool.error = ConnectionError("lost connection")
+        first = asyncio.ensure_future(storage.put("a", 1))
+        await asyncio.sleep(0)
+        # made while the first write is being flushed
+        second = asyncio.ensure_future(storage.put("a", 2))
+
+        for write in (first, second):
+            with pytest.raises(ConnectionError):
+                await write
+
+        await storage.aclose()
+        assert pool.values("tags") == {"a": 2}
+
+    run(main())
+
+
+def test_batch_rolls_back() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await storage.put("a", 1)
+
+        with pytest.raises(ValueError):
+            async with storage.batch():
+                await storage.put("a", 2)
+                await storage.put("b", 3)
+                raise ValueError
+
+        assert storage.all() == {"a": 1}
+        assert pool.values("tags") == {"a": 1}
+
+        async with storage.batch():
+            await storage.put("a", 2)
+            await storage.delete("a")
+            await storage.put("b", 3)
+
+        assert pool.values("tags") == {"b": 3}
+
+    run(main())
+
+
+def test_fetch_does_not_overwrite_newer_writes() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await storage.put("a", 1)
+
+        reader = PostgresStorage(pool, "tags")
+        fetching = asyncio.ensure_future(reader.fetch("a"))
+        await asyncio.sleep(0)
+        await reader.put("a", 2)
+
+        assert await fetching == 2
+        assert reader["a"] == 2
+
+        fetching = asyncio.ensure_future(reader.fetch("b"))
+        await asyncio.sleep(0)
+        await storage.put("b", 3)
+        deleting = asyncio.ensure_future(reader.delete("b"))
+        await asyncio.sleep(0)
+        assert await fetching is None
+        await deleting
+
+    run(main())
+
+
+def test_batch_only_covers_its_task() -> None:
+    async def main() -> None:
+        pool = FakePool()
+        storage = PostgresStorage(pool, "tags")
+        await storage.put("a", 1)
+
+        entered = asyncio.Event()
+        release = asyncio.Event()
+
+        async def batched() -> None:
+            async with storage.batch():
+                await storage.put("a", 2)
+                await storage.put("b", 2)
+                entered.set()
+                await release.wait()
+                raise ValueError
+
+        batching = asyncio.ensure_future(batched())
+        await entered.wait()
+
+        # written right away, and never rolled back by the other task
+        await storage.put("a", 3)
+        await storage.put("c", 3)
+        assert pool.values("tags") == {"a": 3, "c": 3}
+
+        release.set()
+        with pytest.raises(ValueError):
+            await batching
+
+        assert storage.all() == {"a": 3, "c": 3}
+        assert pool.values("tags") == {"a": 3, "c": 3}
+
+    run(main())